@@ -1,8 +1,15 @@
 from __future__ import print_function
+import os
+import json
 from socket import error as socketerror
+import time
+import Queue
 import socket
+import select
+import threading
 
 from ..utils.constants import Constants
+from ..utils.metrics import Metrics
 from ..utils.utils import Retry
 
 
@@ -10,8 +17,15 @@ from ..utils.utils import Retry
 # ASYNC CLIENT
 # ======================================================================================================================
 class AsyncClient():
-    def __init__(self, host, port):
+    """Client for the Needle Agent protocol: each command is answered by a payload terminated by AGENT_OUTPUT_END.
+
+    Incoming data is accumulated in a bytearray, and the end marker is searched across chunk boundaries.
+    Anything received past the marker is kept for the following response.
+    """
+    def __init__(self, host, port, timeout=Constants.AGENT_TIMEOUT_READ):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self._buffer = bytearray()
         try:
             self.socket.connect((host, port))
         except socketerror as se:
@@ -20,18 +34,77 @@ class AsyncClient():
     def close(self):
         if self.socket:
             self.socket.close()
-    
+
+    def is_alive(self):
+        """True if the connection has not been closed by the agent."""
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+            return not readable or self.socket.recv(1, socket.MSG_PEEK) != ''
+        except (socketerror, ValueError):
+            return False
+
     def send_to_device(self, cmd, marker=Constants.AGENT_OUTPUT_END):
-        self.socket.send(cmd + '\r\n')
-        data = ""
+        """Send a command and return its response, stripped of the end marker.
+        Raises if the agent closes the connection, or stays silent for more than AGENT_TIMEOUT_READ seconds: in the
+        latter case the connection is closed, since a late response would be mistaken for the one to the next command."""
+        self.socket.sendall(cmd + '\r\n')
+        buf, offset = self._buffer, 0
         while True:
-            temp = self.socket.recv(8192)
-            if temp:
-                if marker in temp:
-                    data += temp[:temp.find(marker)]
-                    break
-                data += temp
-        return data    
+            end = buf.find(marker, offset)
+            if end >= 0:
+                break
+            # The marker might be split across two reads: resume the search from where it could start
+            offset = max(0, len(buf) - len(marker) + 1)
+            try:
+                chunk = self.socket.recv(Constants.AGENT_RECV_BUFFER)
+            except socket.timeout:
+                self.close()
+                raise socketerror('Timed out waiting for the response to: {}'.format(cmd))
+            if not chunk:
+                raise socketerror('Connection closed by the agent')
+            buf.extend(chunk)
+        data = str(buf[:end])
+        del buf[:end + len(marker)]
+        return data
+
+
+# ======================================================================================================================
+# AGENT FUTURE
+# ======================================================================================================================
+class AgentFuture(object):
+    """Pending result of a command submitted to the agent with NeedleAgent.submit()."""
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result, self._error = None, None
+        self._callbacks = []
+
+    def _set(self, result=None, error=None):
+        with self._lock:
+            self._result, self._error = result, error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks: fn(self)
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the command to complete (for at most `timeout` seconds), then return its output or raise its error."""
+        if not self._event.wait(timeout):
+            raise Exception('Timed out waiting for the agent to complete: {}'.format(self.cmd))
+        if self._error:
+            raise self._error
+        return self._result
+
+    def add_done_callback(self, fn):
+        """Invoke fn(future) once the command completes (immediately, if it already has)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
 
 
 # ======================================================================================================================
@@ -44,6 +117,100 @@ class NeedleAgent(object):
         self._ip = self._device._ip
         self._port = self._device._agent_port
         self.client = None
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._workers = []
+        self._cache = None
+        self._cache_lock = threading.Lock()
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    def _send(self, client, cmd):
+        """Run a command on the given connection, recording size and latency of the response."""
+        self._device.printer.debug("{} Executing command: {}".format(Constants.AGENT_TAG, cmd))
+        start = time.time()
+        with Metrics().measure('agent', cmd, bytes_out=len(cmd)) as m:
+            res = client.send_to_device(cmd)
+            m['bytes_in'] = len(res)
+        self._device.printer.debug("{} Received {} bytes in {:.3f}s".format(Constants.AGENT_TAG, len(res),
+                                                                          time.time() - start))
+        return res
+
+    def _cache_path(self):
+        return os.path.join(Constants.FOLDER_CACHE, 'agent_{}.json'.format(self._device._fingerprint()))
+
+    def _cache_load(self):
+        """Load the responses cached for this device in a previous session (if any)."""
+        if self._cache is None:
+            self._cache = {}
+            try:
+                with open(self._cache_path(), 'r') as fp:
+                    self._cache = {str(k): (ts, res.encode('utf-8')) for k, (ts, res) in json.load(fp).iteritems()}
+            except (IOError, OSError, ValueError):
+                pass
+        return self._cache
+
+    def _cache_save(self):
+        try:
+            if not os.path.exists(Constants.FOLDER_CACHE):
+                os.makedirs(Constants.FOLDER_CACHE)
+            with open(self._cache_path(), 'w') as fp:
+                json.dump(self._cache, fp)
+        except (IOError, OSError) as e:
+            self._device.printer.debug("{} Could not persist the response cache: {}".format(Constants.AGENT_TAG, e))
+
+    def _cache_get(self, cmd):
+        """Return the cached response to `cmd`, if the command is cacheable and the response not older than its TTL."""
+        ttl = Constants.AGENT_CACHE_TTL.get(cmd)
+        if not ttl: return None
+        with self._cache_lock:
+            entry = self._cache_load().get(cmd)
+        if entry and time.time() - entry[0] < ttl:
+            self._device.printer.debug("{} Using cached response for: {}".format(Constants.AGENT_TAG, cmd))
+            return entry[1]
+        return None
+
+    def _cache_set(self, cmd, res):
+        if cmd not in Constants.AGENT_CACHE_TTL: return
+        with self._cache_lock:
+            self._cache_load()[cmd] = (time.time(), res)
+            self._cache_save()
+
+    def _worker(self):
+        """Serve submitted commands over a connection of its own, so that several commands can be in flight at once.
+        If the connection can not be established (or fails), commands fall back to the main connection."""
+        client = None
+        while True:
+            future = self._queue.get()
+            if future is None: break
+            try:
+                if client is None or not client.is_alive():
+                    client = AsyncClient(self._ip, self._port)
+                res = self._send(client, future.cmd)
+                self._cache_set(future.cmd, res)
+                future._set(result=res)
+            except Exception as e:
+                self._device.printer.debug("{} Pooled connection failed ({}), using the main one".format(Constants.AGENT_TAG, e))
+                if client:
+                    client.close()
+                    client = None
+                try:
+                    future._set(result=self.exec_command_agent(future.cmd))
+                except Exception as e:
+                    future._set(error=e)
+        if client: client.close()
+
+    def _start_workers(self):
+        while len(self._workers) < Constants.AGENT_POOL_SIZE:
+            t = threading.Thread(name='agent', target=self._worker)
+            t.setDaemon(True)
+            t.start()
+            self._workers.append(t)
+
+    def _stop_workers(self):
+        for _ in self._workers: self._queue.put(None)
+        self._workers = []
 
     # ==================================================================================================================
     # EXPORTED COMMANDS
@@ -54,11 +221,44 @@ class NeedleAgent(object):
         self._device.printer.notify("{} Successfully connected to agent ({}:{})...".format(Constants.AGENT_TAG, self._ip, self._port))
 
     def disconnect(self):
+        self._stop_workers()
         if self.client:
             self._device.printer.verbose("{} Disconnecting from agent...".format(Constants.AGENT_TAG))
             self.client.close()
 
-    @Retry()
+    def is_alive(self):
+        return self.client is not None and self.client.is_alive()
+
     def exec_command_agent(self, cmd):
-        self._device.printer.debug("{} Executing command: {}".format(Constants.AGENT_TAG, cmd))
-        return self.client.send_to_device(cmd)
+        """Run a command, unless a fresh response is cached (see AGENT_CACHE_TTL)."""
+        res = self._cache_get(cmd)
+        if res is None:
+            res = self._exec_command_agent(cmd)
+            self._cache_set(cmd, res)
+        return res
+
+    @Retry(leg='agent')
+    def _exec_command_agent(self, cmd):
+        with self._lock:
+            return self._send(self.client, cmd)
+
+    def cache_invalidate(self, *cmds):
+        """Drop the cached responses to the given commands (to all of them, if none is given)."""
+        with self._cache_lock:
+            cache = self._cache_load()
+            for cmd in (cmds or cache.keys()):
+                cache.pop(cmd, None)
+            self._cache_save()
+
+    def submit(self, cmd, callback=None):
+        """Queue a command without waiting for it: up to AGENT_POOL_SIZE commands are run concurrently, each on its own
+        connection to the agent. Returns an AgentFuture; `callback`, if provided, is invoked with it on completion."""
+        future = AgentFuture(cmd)
+        if callback: future.add_done_callback(callback)
+        cached = self._cache_get(cmd)
+        if cached is not None:
+            future._set(result=cached)
+            return future
+        self._start_workers()
+        self._queue.put(future)
+        return future
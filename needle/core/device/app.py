@@ -1,25 +1,72 @@
 import os
+import re
+import time
+import shutil
+import zipfile
+import cPickle
 from ..utils.constants import Constants
+from ..utils.macho import MachO
 from ..utils.utils import Utils
+from manifest import AppManifest
 
 
 class App(object):
     def __init__(self, device):
         self._device = device
         self._app = None
+        self._manifests = {}
+        self._metadata_cache = None
+        self._binary_hashes = {}
+        self._process_table = None
 
     # ==================================================================================================================
     # METADATA
     # ==================================================================================================================
     def get_metadata(self, app_name):
-        """Retrieve metadata of the target app."""
-        self._app = app_name
-        return self._retrieve_metadata()
+        """Retrieve metadata of the target app.
 
-    def _retrieve_metadata(self):
-        """Parse MobileInstallation.plist and the app's local Info.plist, and extract metadata."""
+        Metadata are cached on disk (per device), and reused as long as bundle ID, version and container UUID
+        reported by the agent do not change.
+        """
+        self._app = app_name
         # Parse output from the agent
         metadata_agent = self.__parse_from_agent()
+        key = [metadata_agent['bundle_id'], metadata_agent['app_version'], metadata_agent['uuid']]
+        cache = self._metadata_cache_load()
+        entry = cache.get(app_name)
+        if entry and entry['key'] == key:
+            self._device.printer.debug("Using cached metadata for: {}".format(app_name))
+            return Utils.merge_dicts(entry['metadata'], metadata_agent)
+        metadata = self._retrieve_metadata(metadata_agent)
+        cache[app_name] = {'key': key, 'metadata': metadata}
+        self._metadata_cache_save()
+        return metadata
+
+    def _metadata_cache_path(self):
+        return os.path.join(Constants.FOLDER_CACHE, 'metadata_{}.pickle'.format(self._device._fingerprint()))
+
+    def _metadata_cache_load(self):
+        """Load the metadata cached for this device (plist values are kept as they are, hence pickle rather than JSON)."""
+        if self._metadata_cache is None:
+            self._metadata_cache = {}
+            try:
+                with open(self._metadata_cache_path(), 'rb') as fp:
+                    self._metadata_cache = cPickle.load(fp)
+            except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+                pass
+        return self._metadata_cache
+
+    def _metadata_cache_save(self):
+        try:
+            if not os.path.exists(Constants.FOLDER_CACHE):
+                os.makedirs(Constants.FOLDER_CACHE)
+            with open(self._metadata_cache_path(), 'wb') as fp:
+                cPickle.dump(self._metadata_cache, fp, cPickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError, cPickle.PicklingError) as e:
+            self._device.printer.debug("Could not persist the metadata cache: {}".format(e))
+
+    def _retrieve_metadata(self, metadata_agent):
+        """Parse MobileInstallation.plist and the app's local Info.plist, and extract metadata."""
 
         # Content of the app's local Info.plist
         plist_info_path = Utils.escape_path('%s/Info.plist' % metadata_agent['binary_directory'], escape_accent=True)
@@ -63,7 +110,7 @@ class App(object):
         minimum_os       = self.__extract_field(agent_info, 'MinimumOS')
         team_id          = self.__extract_field(agent_info, 'TeamID')
         signer_identity  = self.__extract_field(agent_info, 'SignerIdentity')
-        uuid = bundle_directory.rsplit('/', 1)[-1]
+        uuid = self.__container_uuid(bundle_directory)
 
         # Pack into a dict
         metadata = {
@@ -111,15 +158,26 @@ class App(object):
         return metadata
 
     def __detect_architectures(self, binary):
-        """Use lipo to detect supported architectures."""
+        """Read the architectures from the Mach-O header, falling back to lipo if it can not be parsed."""
+        try:
+            return [sl.arch for sl in self.get_slices(binary)]
+        except Exception as e:
+            self._device.printer.debug("Could not parse the Mach-O header ({}), using lipo".format(e))
         # Run lipo
         cmd = '{lipo} -info {binary}'.format(lipo=Constants.DEVICE_TOOLS['LIPO'], binary=binary)
-        out = self._device.remote_op.command_blocking(cmd, internal=True)
+        out = self._device.remote_op.command_blocking(cmd, internal=True, write=False, idempotent=True)
         # Parse output
         msg = out[0].strip()
         res = msg.rsplit(': ')[-1].split(' ')
         return res
 
+    @staticmethod
+    def __container_uuid(bundle_directory):
+        """UUID of the bundle container, out of its (escaped) path: the last component shaped as a UUID."""
+        parts = Utils.unescape_path(bundle_directory).rstrip('/').split('/')
+        uuids = [p for p in parts if re.match(r'^[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}$', p, re.I)]
+        return uuids[-1] if uuids else parts[-1]
+
     def __extract_field(self, data, field, path=False, urldecode=False):
         """Extract the specified entry from the plist file. Returns empty string if not present."""
         try:
@@ -179,25 +237,115 @@ class App(object):
         """Launch the app with the specified Bundle ID."""
         cmd = '{open} {app}'.format(open=self._device.DEVICE_TOOLS['OPEN'], app=bundle_id)
         self._device.remote_op.command_blocking(cmd, internal=True)
+        # The process table is about to change
+        self._process_table = None
 
-    def search_pid(self, binary_name):
-        """Retrieve the PID of the app's process."""
+    # ==================================================================================================================
+    # PROCESSES
+    # ==================================================================================================================
+    PS_CMD = 'ps -axo pid=,ppid=,comm='
+
+    def _parse_process_table(self, out):
+        """Parse the output of PS_CMD into a dict: {pid: (ppid, executable path)}."""
+        table = {}
+        for line in out:
+            fields = line.strip().split(None, 2)
+            if len(fields) == 3 and fields[0].isdigit():
+                table[fields[0]] = (fields[1], fields[2])
+        self._process_table = (time.time(), table)
+        return table
+
+    def process_table(self, refresh=False):
+        """Snapshot of the processes running on the device, cached for PROCESS_TABLE_TTL seconds."""
+        if not refresh and self._process_table and time.time() - self._process_table[0] < Constants.PROCESS_TABLE_TTL:
+            return self._process_table[1]
+        return self._parse_process_table(self._device.remote_op.command_blocking(self.PS_CMD, write=False, idempotent=True))
+
+    def wait_for_process(self, binary_name, binary_path=None, timeout=Constants.PID_WAIT_TIMEOUT):
+        """Wait for a process of the app to appear, and return the process table as soon as it does.
+        The executable must be exactly `binary_path` (if given), or end with .app/<binary_name>.
+        The polling loop (every PID_WAIT_POLL seconds) runs on the device, so it costs a single remote command."""
+        def ere(text):
+            return re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', text)
+        if binary_path:
+            path = Utils.unescape_path(binary_path)
+            path = path[len('/private'):] if path.startswith('/private/') else path
+            needle = Utils.escape_path('[[:space:]](/private)?{}[[:space:]]*$'.format(ere(path)))
+        else:
+            needle = Utils.escape_path('\\.app/{}[[:space:]]*$'.format(ere(binary_name)))
+        cmd = ('i=0; while [ $i -lt {tries} ]; do out=$({ps}); echo "$out" | grep -qE -- {needle} && break; '
+               'sleep {poll}; i=$((i+1)); done; echo "$out"').format(tries=int(timeout / Constants.PID_WAIT_POLL),
+                                                                    ps=self.PS_CMD,
+                                                                    needle=needle,
+                                                                    poll=Constants.PID_WAIT_POLL)
+        out = self._device.remote_op.command_blocking(cmd, timeout=timeout + Constants.SSH_COMMAND_TIMEOUT, write=False, idempotent=True)
+        return self._parse_process_table(out)
+
+    def _match_pid(self, table, binary_name, binary_path=None):
+        """Find the app's process: exact match on the path of its executable, then on its name (preferring processes
+        run from an app bundle, and the most recent one)."""
+        def normalize(path):
+            return path[len('/private'):] if path.startswith('/private/') else path
+        if binary_path:
+            target = normalize(Utils.unescape_path(binary_path))
+            for pid, (ppid, exe) in table.items():
+                if normalize(exe) == target:
+                    return pid
+        matches = [pid for pid, (ppid, exe) in table.items() if os.path.basename(exe) == binary_name]
+        candidates = [pid for pid in matches if '.app/' in table[pid][1]] or matches
+        return max(candidates, key=int) if candidates else None
+
+    def search_pid(self, binary_name, binary_path=None, wait=False):
+        """Retrieve the PID of the app's process, matching the path of its executable if `binary_path` is given.
+        Set `wait` right after launching the app, to wait (up to PID_WAIT_TIMEOUT seconds) for the process to appear."""
         self._device.printer.verbose('Retrieving the PID...')
-        cmd = "ps ax | grep -i '{binary_name}'".format(binary_name=binary_name)
-        out = self._device.remote_op.command_blocking(cmd)
-        try:
-            process_list = filter(lambda x: 'grep' not in x, out)
-            if not process_list:
-                process_list = filter(lambda x: '/var/containers' in x, out)
-            process = process_list[0].strip()
-            pid = process.split(' ')[0]
-            self._device.printer.verbose('PID found: %s' % pid)
-            return pid
-        except Exception as e:
+        table = self.wait_for_process(binary_name, binary_path) if wait else self.process_table()
+        pid = self._match_pid(table, binary_name, binary_path)
+        if pid is None and not wait:
+            # The cached snapshot might predate the process
+            pid = self._match_pid(self.process_table(refresh=True), binary_name, binary_path)
+        if pid is None:
             raise Exception("PID not found")
+        self._device.printer.verbose('PID found: %s' % pid)
+        return pid
 
     def decrypt(self, app_metadata, thin=False):
-        """Decrypt the binary and unzip the IPA. Returns the full path of the decrypted binary"""
+        """Decrypt the binary and unzip the IPA. Returns the full path of the decrypted binary (thinned, if `thin`).
+        The binary is served from the decrypted cache if the same version of the app has already been decrypted."""
+        name = 'binary_{}'.format(Constants.PREFERRED_ARCH) if thin else 'binary'
+        fname_binary = self._decrypted_get(app_metadata, name)
+        if fname_binary:
+            return fname_binary
+        fname_binary = self._decrypt(app_metadata)
+        self._decrypted_put(app_metadata, 'binary', fname_binary)
+        # Thin the binary
+        if thin:
+            fname_binary = self.thin_binary(app_metadata, fname_binary)
+            self._decrypted_put(app_metadata, name, fname_binary)
+        return fname_binary
+
+    def pull_decrypted_ipa(self, app_metadata, dst):
+        """Decrypt the app and pull its IPA to `dst`, copying it from the decrypted cache if already available."""
+        key, binary_hash = self._decrypted_key(app_metadata)
+        cached = self._device.decrypted_cache.get(key, 'ipa')
+        if cached:
+            self._device.printer.info("Using the cached decrypted IPA...")
+            shutil.copyfile(cached, dst)
+            return
+        fname_binary = self._decrypt(app_metadata)
+        self._device.pull(self._device.remote_op.build_temp_path_for_file('decrypted.ipa'), dst, resumable=True)
+        self._device.decrypted_cache.put(key, 'ipa', dst, app_metadata['bundle_id'], app_metadata['app_version'], binary_hash)
+        # The decrypted binary is already in the IPA just pulled: cache it from there, rather than downloading it again
+        try:
+            local = self._device.local_op.build_temp_path_for_file('binary', None, path=Constants.FOLDER_TEMP)
+            self.extract_binary_local(app_metadata, dst, local)
+        except Exception as e:
+            self._device.printer.warning("Could not cache the decrypted binary: {}".format(e))
+        else:
+            self._decrypted_put(app_metadata, 'binary', fname_binary, local=local)
+
+    def _decrypt(self, app_metadata):
+        """Run Clutch, then unzip the IPA. Returns the full path of the decrypted binary."""
         # Run Clutch
         self._device.printer.info("Decrypting the binary...")
         cmd = '{bin} -d {bundle} 2>&1'.format(bin=self._device.DEVICE_TOOLS['CLUTCH'], bundle=app_metadata['bundle_id'])
@@ -209,10 +357,13 @@ class App(object):
             # Parse the output filename
             res = filter(lambda x: x.startswith('DONE'), out)
             out_temp = res[0].split(':')[1].strip()            # 'DONE: /private/var/mobile/Documents/Dumped/uid.ipa'
-            # Move IPA to TEMP folder
-            self._device.remote_op.file_copy(out_temp, fname_decrypted)
-            # Remove temp IPA
-            self._device.remote_op.file_delete(out_temp)
+            # Move IPA to TEMP folder, then remove temp IPA
+            batch = self._device.remote_op.batch()
+            batch.file_copy(out_temp, fname_decrypted)
+            batch.file_delete(out_temp)
+            res = batch.run()
+            if not res[0].result:
+                raise Exception(''.join(res[0].output))
         except Exception:
             # Check if Clutch failed somehow
             msg = None
@@ -235,69 +386,186 @@ class App(object):
         self._device.printer.debug("Decrypted IPA stored at: %s" % fname_decrypted)
 
         # Unzip IPA and get binary path
-        fname_binary = self.unpack_ipa(app_metadata, fname_decrypted)
-
-        # Thin the binary
-        if thin:
-            return self.thin_binary(app_metadata, fname_binary)
-        return fname_binary
+        return self.unpack_ipa(app_metadata, fname_decrypted)
 
     def thin_binary(self, app_metadata, fname_binary, arch=Constants.PREFERRED_ARCH):
+        """Cut the slice of the requested architecture out of the binary, in place (no second copy is left on the device)."""
         self._device.printer.info("Thinning the binary...")
-        if arch in app_metadata['architectures']:
-            fname_thinned = self._device.remote_op.build_temp_path_for_file('thinned')
-            cmd = '{bin} -thin {arch} -output {output} {binary}'.format(bin=self._device.DEVICE_TOOLS['LIPO'],
-                                                                    arch=arch,
-                                                                    output=fname_thinned,
-                                                                    binary=fname_binary)
-            self._device.remote_op.command_blocking(cmd)
-            self._device.printer.debug("Thinned IPA stored at: %s" % fname_thinned)
-            return fname_thinned
-        else:
+        slices = {sl.arch: sl for sl in self.get_slices(fname_binary)}
+        if arch not in slices:
             self._device.printer.warning('Binary does not include the requested architecture ({}). Skipping...'.format(arch))
             return fname_binary
+        if len(slices) == 1:
+            self._device.printer.debug("The binary is already thin")
+            return fname_binary
+        sl = slices[arch]
+        fname_thinned = '{}.thin'.format(fname_binary)
+        cmd = 'tail -c +{start} {binary} | head -c {size} > {output} && mv {output} {binary}'.format(start=sl.offset + 1,
+                                                                                                  size=sl.size,
+                                                                                                  binary=Utils.escape_path(fname_binary),
+                                                                                                  output=Utils.escape_path(fname_thinned))
+        self._device.remote_op.command_blocking(cmd)
+        self._device.remote_op.cache_invalidate(fname_binary, fname_thinned)
+        self._device.printer.debug("Thinned binary ({}) stored at: {}".format(arch, fname_binary))
+        return fname_binary
+
+    # ==================================================================================================================
+    # DECRYPTED CACHE
+    # ==================================================================================================================
+    def _decrypted_key(self, app_metadata):
+        """Return (key in the decrypted cache, hash of the installed binary). The hash is computed once per session."""
+        binary = Utils.unescape_path(app_metadata['binary_path'])
+        if binary not in self._binary_hashes:
+            self._binary_hashes[binary] = self._device.remote_op.remote_sha256(binary)
+        binary_hash = self._binary_hashes[binary]
+        return self._device.decrypted_cache.key(app_metadata['bundle_id'], app_metadata['app_version'], binary_hash), binary_hash
+
+    def _decrypted_get(self, app_metadata, name):
+        """Return the path on the device of a cached artifact, uploading it from the local cache if needed.
+        A missing slice is cut out of the cached fat binary locally. Returns None on a miss."""
+        key, binary_hash = self._decrypted_key(app_metadata)
+        remote = os.path.join(Constants.DEVICE_PATH_CACHE_FOLDER, key, name)
+        if self._device.decrypted_cache_device and self._device.remote_op.file_exist(remote):
+            self._device.printer.info("Using the decrypted binary cached on the device...")
+            return remote
+        cache = self._device.decrypted_cache
+        local = cache.get(key, name)
+        if local is None and name != 'binary' and cache.get(key, 'binary'):
+            fat = cache.get(key, 'binary')
+            with open(fat, 'rb') as fp:
+                slices = {sl.arch: sl for sl in MachO.parse_slices(fp.read(Constants.MACHO_HEADER_SIZE), os.path.getsize(fat))}
+            arch = name.split('_', 1)[1]
+            if arch not in slices or len(slices) == 1:
+                local = fat
+            else:
+                MachO.extract_slice(fat, cache.path(key, name), slices[arch])
+                local = cache.put(key, name, cache.path(key, name), app_metadata['bundle_id'], app_metadata['app_version'], binary_hash)
+        if local is None:
+            return None
+        self._device.printer.info("Using the cached decrypted binary...")
+        if self._device.decrypted_cache_device:
+            self._device.remote_op.dir_create(Constants.DEVICE_PATH_CACHE_FOLDER)
+            self._device.remote_op.dir_create(os.path.dirname(remote))
+        else:
+            remote = self._device.remote_op.build_temp_path_for_file(name)
+        self._device.remote_op.upload(local, remote, recursive=False)
+        return remote
+
+    def _decrypted_put(self, app_metadata, name, fname, local=None):
+        """Store an artifact just produced on the device in the decrypted cache (and on the device, if enabled).
+        If a `local` copy of the artifact is already available it is moved into the cache, instead of downloading `fname`.
+        Failures are not fatal: the artifact will simply be produced again next time."""
+        try:
+            key, binary_hash = self._decrypted_key(app_metadata)
+            if local is None:
+                local = self._device.local_op.build_temp_path_for_file(name, None, path=Constants.FOLDER_TEMP)
+                self._device.remote_op.download(fname, local)
+            self._device.decrypted_cache.put(key, name, local, app_metadata['bundle_id'], app_metadata['app_version'], binary_hash)
+            os.remove(local)
+            if self._device.decrypted_cache_device:
+                remote = os.path.join(Constants.DEVICE_PATH_CACHE_FOLDER, key, name)
+                self._device.remote_op.dir_create(Constants.DEVICE_PATH_CACHE_FOLDER)
+                self._device.remote_op.dir_create(os.path.dirname(remote))
+                self._device.remote_op.file_copy(fname, remote)
+        except Exception as e:
+            self._device.printer.warning("Could not cache the decrypted binary: {}".format(e))
+
+    # ==================================================================================================================
+    # MACH-O SLICES
+    # ==================================================================================================================
+    def get_slices(self, binary):
+        """List the slices (arch, offset, size) of a binary on the device, from a ranged read of its header."""
+        header = self._device.remote_op.read_range(binary, 0, Constants.MACHO_HEADER_SIZE)
+        return MachO.parse_slices(header, self._device.remote_op.file_size(binary))
+
+    def get_binary_info(self, binary, slice):
+        """PIE flag and encryption status of a slice of a binary on the device, from its load commands."""
+        data = self._device.remote_op.read_range(binary, slice.offset, Constants.MACHO_HEADER_SIZE)
+        size = MachO.commands_size(data)
+        if size > len(data):
+            data = self._device.remote_op.read_range(binary, slice.offset, size)
+        return MachO.parse_info(data)
 
     # ==================================================================================================================
     # UNPACK AN IPA FILE
     # ==================================================================================================================
+    def _ipa_binary_member(self, archive, app_metadata):
+        """Locate Payload/<name>.app/<CFBundleExecutable> in the central directory of the IPA."""
+        for name in archive.namelist():
+            parts = name.split('/')
+            if len(parts) == 3 and parts[0] == 'Payload' and parts[1].endswith('.app') and parts[2] == app_metadata['binary_name']:
+                return name
+        raise Exception('Binary not found in the IPA: {}'.format(app_metadata['binary_name']))
+
     def unpack_ipa(self, app_metadata, ipa_fname):
+        """Extract the application binary from an IPA on the device, and return its full path.
+
+        Only the central directory of the archive is read (with ranged SFTP reads) to locate the binary, which is then
+        the only member extracted: the rest of the app (assets, frameworks, ...) is never unzipped.
+        """
+        self._device.printer.info("Extracting the binary from the IPA...")
+        with self._device.remote_op.open_file(ipa_fname) as fp:
+            member = self._ipa_binary_member(zipfile.ZipFile(fp), app_metadata)
+
         # Leftovers Cleanup
         payload_folder = '%s%s' % (self._device.TEMP_FOLDER, 'Payload')
-        itunes = '%s%s' % (self._device.TEMP_FOLDER, 'iTunesArtwork')
-        if self._device.remote_op.dir_exist(payload_folder): self._device.remote_op.dir_delete(payload_folder)
-        if self._device.remote_op.file_exist(itunes): self._device.remote_op.file_delete(itunes)
-
-        # Unzip
-        self._device.printer.info("Unpacking the IPA...")
-        cmd = '{bin} {ipa} -d {folder}'.format(bin=self._device.DEVICE_TOOLS['UNZIP'],
-                                               ipa=ipa_fname,
-                                               folder=self._device.TEMP_FOLDER)
-        out = self._device.remote_op.command_blocking(cmd)
-
-        # Get full path to the binary
-        cmd = '{find} {folder} -type f -name "{appname}"'.format(find=self._device.DEVICE_TOOLS['FIND'],
-                                                                 folder=self._device.TEMP_FOLDER,
-                                                                 appname=app_metadata['binary_name'])
-        out = self._device.remote_op.command_blocking(cmd)
-        fname_binary = out[0].strip()
+        self._device.remote_op.dir_delete(payload_folder, force=True)
+
+        # Unzip the binary only (unzip takes member names as wildcard patterns: escape them so they match literally)
+        cmd = '{bin} -o {ipa} {member} -d {folder}'.format(bin=self._device.DEVICE_TOOLS['UNZIP'],
+                                                           ipa=Utils.escape_path(ipa_fname),
+                                                           member=Utils.escape_path(re.sub(r'([\\\[\]*?])', r'\\\1', member)),
+                                                           folder=self._device.TEMP_FOLDER)
+        self._device.remote_op.command_blocking(cmd, write=True, idempotent=True)
+        fname_binary = os.path.join(self._device.TEMP_FOLDER, member)
+        self._device.remote_op.cache_invalidate(fname_binary)
         self._device.printer.debug("Full path of the application binary: %s" % fname_binary)
         return fname_binary
 
+    def extract_binary_local(self, app_metadata, ipa_fname, dst):
+        """Extract the application binary from a local IPA into `dst`, decompressing it on the fly."""
+        with zipfile.ZipFile(ipa_fname) as archive:
+            member = self._ipa_binary_member(archive, app_metadata)
+            with archive.open(member) as fr, open(dst, 'wb') as fw:
+                shutil.copyfileobj(fr, fw, Constants.SFTP_CHUNK_SIZE)
+        self._device.printer.debug("Extracted {} from {}".format(member, ipa_fname))
+        return dst
+
     # ==================================================================================================================
     # MANIPULATE FILES
     # ==================================================================================================================
     def get_dataprotection(self, filelist):
-        """Get the Data Protection of the files contained in 'filelist'."""
-        computed = []
-        for el in filelist:
-            fname = Utils.escape_path(el.strip())
-            dp = '{bin} -f {fname}'.format(bin=self._device.DEVICE_TOOLS['FILEDP'], fname=fname)
-            dp += ' 2>&1'                                            # needed because by default FileDP prints to STDERR
-            res = self._device.remote_op.command_blocking(dp, internal=True)
-            # Parse class
-            cl = res[0].rsplit(None, 1)[-1]
-            computed.append((fname, cl))
-        return computed
+        """Get the Data Protection of the files contained in 'filelist'.
+
+        The list is written to a temp file on the device, and FileDP is run on all its entries by a single remote
+        invocation, which prints one "<path>\t<FileDP output>" line per file.
+        """
+        paths = [Utils.unescape_path(el.strip()) for el in filelist]
+        if not paths: return []
+        listfile = self._device.remote_op.build_temp_path_for_file('dataprotection.lst')
+        self._device.remote_op.write_file_raw(listfile, '\n'.join(paths) + '\n')
+        cmd = '''while IFS= read -r f; do printf '%s\\t%s\\n' "$f" "$({bin} -f "$f" 2>&1 | head -n 1)"; done < {lst}'''.format(
+            bin=self._device.DEVICE_TOOLS['FILEDP'], lst=listfile)  # FileDP prints to STDERR
+        try:
+            out = self._device.remote_op.command_blocking(cmd, timeout=Constants.FILEDP_TIMEOUT, write=False, idempotent=True)
+        finally:
+            self._device.remote_op.file_delete(listfile)
+        # Parse class
+        classes = {}
+        for line in out:
+            path, sep, res = line.rstrip('\n').rpartition('\t')
+            if not sep: continue
+            classes[path] = res.rsplit(None, 1)[-1] if res.strip() else 'N/A'
+        return [(Utils.escape_path(path), classes.get(path, 'N/A')) for path in paths]
+
+    def get_manifest(self, app_metadata, refresh=False):
+        """Get the manifest of the app's containers, building it if missing, expired, or if `refresh` is True."""
+        key = app_metadata['bundle_id']
+        manifest = self._manifests.get(key)
+        if refresh or manifest is None or not manifest.is_fresh():
+            manifest = AppManifest(self._device, app_metadata).build()
+            self._manifests[key] = manifest
+        return manifest
 
     def convert_path_to_filename(self, fname, app_metadata):
         """Convert a path to a file name, stripping the path of the bundle/data."""
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+from ..utils.constants import Constants
+
+
+# ======================================================================================================================
+# LOCAL CACHE OF DECRYPTED ARTIFACTS
+# ======================================================================================================================
+class DecryptedCache(object):
+    """Local cache of the artifacts obtained by decrypting an app (the IPA, the binary, its thinned slices), shared by
+    all the binary/* modules.
+
+    Entries are keyed by (bundle ID, app version, hash of the binary installed on the device), so an app is only
+    decrypted again once it gets updated. Each entry is a folder holding one file per artifact, described in an index.
+    """
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    INDEX = 'index.json'
+
+    def __init__(self, folder=Constants.FOLDER_CACHE_DECRYPTED):
+        self._folder = folder
+        self._lock = threading.Lock()
+        if not os.path.exists(self._folder):
+            os.makedirs(self._folder)
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    @staticmethod
+    def key(bundle_id, app_version, binary_hash):
+        """Build the key of a decrypted app."""
+        return hashlib.sha1('\0'.join([bundle_id, str(app_version), binary_hash])).hexdigest()
+
+    def _index_load(self):
+        try:
+            with open(os.path.join(self._folder, self.INDEX), 'r') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _index_save(self, index):
+        tmp = os.path.join(self._folder, '{}.tmp'.format(self.INDEX))
+        with open(tmp, 'w') as fp:
+            json.dump(index, fp)
+        os.rename(tmp, os.path.join(self._folder, self.INDEX))
+
+    def path(self, key, name):
+        """Local path of an artifact of the entry (whether cached or not)."""
+        return os.path.join(self._folder, key, name)
+
+    # ==================================================================================================================
+    # EXPOSED COMMANDS
+    # ==================================================================================================================
+    def get(self, key, name):
+        """Return the local path of a cached artifact, or None on a miss."""
+        local = self.path(key, name)
+        with self._lock:
+            if not os.path.isfile(local):
+                return None
+            index = self._index_load()
+            if key in index:
+                index[key]['used'] = time.time()
+                self._index_save(index)
+        return local
+
+    def put(self, key, name, src, bundle_id, app_version, binary_hash):
+        """Store a copy of the local file `src` as the artifact `name` of the entry."""
+        local = self.path(key, name)
+        with self._lock:
+            if not os.path.exists(os.path.dirname(local)):
+                os.makedirs(os.path.dirname(local))
+            tmp = '{}.tmp{}'.format(local, threading.current_thread().ident)
+            shutil.copyfile(src, tmp)
+            os.rename(tmp, local)
+            index = self._index_load()
+            entry = index.setdefault(key, {'bundle_id': bundle_id, 'app_version': app_version,
+                                           'binary_hash': binary_hash, 'created': time.time(), 'artifacts': {}})
+            entry['artifacts'][name] = os.path.getsize(local)
+            entry['used'] = time.time()
+            self._index_save(index)
+        return local
+
+    def entries(self):
+        """Return the cached entries, as (key, description) tuples, the most recently used first."""
+        with self._lock:
+            index = self._index_load()
+        return sorted(index.items(), key=lambda x: x[1].get('used', 0), reverse=True)
+
+    def evict(self, prefix=None):
+        """Remove the entries whose key (or bundle ID, case insensitive) starts with `prefix` (all of them, if no prefix is given).
+        Returns the keys removed."""
+        with self._lock:
+            index = self._index_load()
+            keys = [k for k, v in index.items()
+                    if not prefix or k.startswith(prefix.lower()) or v['bundle_id'].lower().startswith(prefix.lower())]
+            for key in keys:
+                shutil.rmtree(os.path.join(self._folder, key), ignore_errors=True)
+                index.pop(key)
+            self._index_save(index)
+        return keys
@@ -1,9 +1,16 @@
 from __future__ import print_function
+import time
+import select
+import threading
+import contextlib
 import paramiko
-from sshtunnel import SSHTunnelForwarder
 
 from app import App
+from decrypted_cache import DecryptedCache
+from file_cache import FileCache
+from port_forward import PortForward
 from remote_operations import RemoteOperations
+from remote_shell import RemoteShell
 from agent import NeedleAgent
 from ..framework.local_operations import LocalOperations
 from ..utils.constants import Constants
@@ -27,8 +34,11 @@ class Device(object):
     _port_forward_ssh, _port_forward_agent = None, None
     # App specific
     _applist, _ios_version = None, None
+    _applist_future = None
+    _applist_raw, _applist_all = None, None
     # Reference to External Objects
     ssh, agent = None, None
+    _sftp, _shell = None, None
     app, installer = None, None
     local_op, remote_op = None, None
     printer = None
@@ -39,7 +49,8 @@ class Device(object):
     # ==================================================================================================================
     # INIT
     # ==================================================================================================================
-    def __init__(self, ip, port, agent_port, username, password, pub_key_auth, tools):
+    def __init__(self, ip, port, agent_port, username, password, pub_key_auth, tools, persistent_shell=False, pull_cache_size=0,
+                 decrypted_cache_device=False):
         # Setup params
         self._ip = ip
         self._port = port
@@ -48,6 +59,13 @@ class Device(object):
         self._password = password
         self._pub_key_auth = bool(pub_key_auth)
         self._tools_local = tools
+        self.persistent_shell = bool(persistent_shell)
+        self.pull_cache = FileCache(Constants.FOLDER_CACHE_PULL, int(pull_cache_size or 0) * 1024 * 1024)
+        self.decrypted_cache = DecryptedCache()
+        self.decrypted_cache_device = bool(decrypted_cache_device)
+        self.connect_timings = {}
+        self._channels_lock = threading.Lock()
+        self._thread = threading.local()
         # Init related objects
         self.app = App(self)
         self.local_op = LocalOperations()
@@ -67,6 +85,9 @@ class Device(object):
         self.printer.debug('Setting up USB port forwarding on port %s' % self._port)
         cmd = '{app} -t 22:{port}'.format(app=self._tools_local['TCPRELAY'], port=self._port)
         self._port_forward_ssh = self.local_op.command_subproc_start(cmd)
+        # Wait for the relay to be up and sshd to greet through it
+        if not self.local_op.wait_for_port('127.0.0.1', self._port, banner=Constants.SSH_BANNER):
+            raise Exception('USB port forwarding on port %s did not come up. Is the device connected?' % self._port)
 
     def _portforward_usb_stop(self):
         """Stop USB port forwarding."""
@@ -84,6 +105,8 @@ class Device(object):
             ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             ssh.connect(self._ip, port=self._port, username=self._username, password=self._password,
                         allow_agent=self._pub_key_auth, look_for_keys=self._pub_key_auth)
+            # Keepalives detect dead links (and keep NAT/USB relays from dropping idle connections)
+            ssh.get_transport().set_keepalive(Constants.SSH_KEEPALIVE)
             self.printer.notify("[SSH] Connected ({}:{})".format(self._ip, self._port))
             return ssh
         except paramiko.AuthenticationException as e:
@@ -97,32 +120,167 @@ class Device(object):
     def _disconnect_ssh(self):
         """Close the SSH connection, if available."""
         self.printer.verbose("[SSH] Disconnecting...")
+        if self._sftp:
+            self._sftp.close()
+            self._sftp = None
+        if self._shell:
+            self._shell.close()
+            self._shell = None
         if self.ssh:
             self.ssh.close()
 
-    @Retry()
-    def _exec_command_ssh(self, cmd, internal):
-        """Execute a shell command on the device, then parse/print output."""
-        def hotfix_67():
-            # TODO: replace with a more long-term fix
-            import time
-            timeout = 30
-            endtime = time.time() + timeout
-            while not stdout.channel.eof_received:
-                time.sleep(1)
-                if time.time() > endtime:
-                    stdout.channel.close()
+    def _transport(self):
+        """Return the Transport of the SSH connection: exec channels, SFTP and port forwards are all multiplexed over it."""
+        return self.ssh.get_transport()
+
+    def _open_sftp(self):
+        self.printer.debug("[SSH] Opening SFTP session...")
+        return paramiko.SFTPClient.from_transport(self._transport(),
+                                                  window_size=Constants.SFTP_WINDOW_SIZE,
+                                                  max_packet_size=Constants.SFTP_MAX_PACKET_SIZE)
+
+    def _get_sftp(self):
+        """Return an SFTP session opened on the existing SSH Transport (opened only once per connection).
+
+        An SFTPClient cannot serve requests from several threads at once (replies would be read by the wrong thread):
+        within exec_channels(), the current thread gets a session of its own.
+        """
+        if getattr(self._thread, 'exec_channels', False):
+            sftp = getattr(self._thread, 'sftp', None)
+            if sftp is None or sftp.sock.closed:
+                sftp = self._thread.sftp = self._open_sftp()
+            return sftp
+        with self._channels_lock:
+            if self._sftp is None:
+                self._sftp = self._open_sftp()
+            return self._sftp
+
+    def _fingerprint(self):
+        """Fingerprint of the host key of the device, used to tell devices apart."""
+        return self._transport().get_remote_server_key().get_fingerprint().encode('hex')
+
+    def _wait_for_completion(self, channel, timeout):
+        """Drain STDOUT/ERR of an exec channel until the remote command completes.
+
+        Wakes on channel events (data, EOF) instead of sleeping on a fixed tick. Completion is signalled by EOF (or the
+        channel being closed) only: the exit status can be sent before the last chunks of output, so it is just recorded.
+        If the command has not completed within `timeout` seconds the channel is closed and the partial output returned.
+        """
+        out, err = [], []
+        endtime = time.time() + timeout
+        while True:
+            # Drain what has been received so far, so the remote end never stalls on a full window
+            while channel.recv_ready():
+                out.append(channel.recv(Constants.SSH_RECV_BUFFER))
+            while channel.recv_stderr_ready():
+                err.append(channel.recv_stderr(Constants.SSH_RECV_BUFFER))
+            # EOF received (or channel closed): all the output has been sent
+            if channel.eof_received or channel.closed:
+                break
+            # Block until the channel signals new data or EOF
+            remaining = endtime - time.time()
+            if remaining <= 0:
+                self.printer.debug('[SSH] Command did not complete within {} seconds, closing channel'.format(timeout))
+                channel.close()
+                break
+            select.select([channel], [], [], remaining)
+        # Collect any output left after EOF
+        while channel.recv_ready():
+            out.append(channel.recv(Constants.SSH_RECV_BUFFER))
+        while channel.recv_stderr_ready():
+            err.append(channel.recv_stderr(Constants.SSH_RECV_BUFFER))
+        # The exit status might follow EOF: wait for it, within the same timeout
+        if not channel.exit_status_ready():
+            channel.status_event.wait(max(endtime - time.time(), 0))
+        status = channel.exit_status if channel.exit_status_ready() else None
+        return ''.join(out).splitlines(True), ''.join(err).splitlines(True), status
+
+    def _stream_command_channel(self, cmd, timeout, raw=False):
+        """Run a command on a new exec channel, and yield its STDOUT as it arrives (lines, or raw chunks if `raw`).
+
+        Data is only read from the channel when the consumer asks for more, so the SSH window provides back-pressure
+        to the remote command. `timeout` applies to the time spent waiting for new data. STDERR is logged at the end.
+        """
+        stdin, stdout, stderr = self.ssh.exec_command(cmd)
+        channel = stdout.channel
+        err, pending = [], ''
+        try:
+            while True:
+                # STDERR shares the window with STDOUT: keep draining it
+                while channel.recv_stderr_ready():
+                    err.append(channel.recv_stderr(Constants.SSH_RECV_BUFFER))
+                if channel.recv_ready():
+                    data = channel.recv(Constants.SSH_RECV_BUFFER)
+                    if raw:
+                        yield data
+                        continue
+                    # Only yield complete lines
+                    pending += data
+                    lines = pending.splitlines(True)
+                    pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+                    for line in lines:
+                        yield line
+                    continue
+                if channel.eof_received or channel.closed:
+                    break
+                r, w, x = select.select([channel], [], [], timeout)
+                if not r:
+                    self.printer.debug('[SSH] No output received for {} seconds, closing channel'.format(timeout))
                     break
+            if pending:
+                yield pending
+        finally:
+            channel.close()
+        if err:
+            self.printer.debug('[SSH] STDERR: {}'.format(''.join(err).strip()))
 
+    def _exec_command_channel(self, cmd, timeout):
+        """Run a command on a new exec channel of the SSH Transport. Safe to call from multiple threads."""
         # Paramiko Exec Command
         stdin, stdout, stderr = self.ssh.exec_command(cmd)
-        hotfix_67()
+        return self._wait_for_completion(stdout.channel, timeout)
+
+    def _get_shell(self):
+        """Return the persistent shell, (re)opening it on the SSH Transport if needed."""
+        with self._channels_lock:
+            if self._shell is None or not self._shell.is_active():
+                self.printer.debug("[SSH] Opening persistent shell...")
+                self._shell = RemoteShell(self._transport())
+            return self._shell
+
+    @contextlib.contextmanager
+    def exec_channels(self):
+        """Within this block, the commands issued by the current thread run on their own exec channels, bypassing the
+        persistent shell (e.g., in worker pools, where a single shell would serialize them), and its file transfers on
+        an SFTP session of its own, closed on exit."""
+        previous = getattr(self._thread, 'exec_channels', False)
+        self._thread.exec_channels = True
+        try:
+            yield
+        finally:
+            self._thread.exec_channels = previous
+            sftp = getattr(self._thread, 'sftp', None)
+            if not previous and sftp:
+                self._thread.sftp = None
+                sftp.close()
+
+    @Retry()
+    def _exec_command_ssh(self, cmd, internal, timeout=None, use_shell=True, check=True):
+        """Execute a shell command on the device, then parse/print output. Returns (stdout, stderr, exit status).
+
+        The command goes through the persistent shell if enabled (and `use_shell` is True), otherwise on a new exec channel.
+        With `check`, internal commands writing to STDERR raise an exception.
+        """
+        if timeout is None:
+            timeout = Constants.SSH_COMMAND_TIMEOUT
+        if self.persistent_shell and use_shell and not getattr(self._thread, 'exec_channels', False):
+            out, err, status = self._get_shell().run(cmd, timeout)
+        else:
+            out, err, status = self._exec_command_channel(cmd, timeout)
         # Parse STDOUT/ERR
-        out = stdout.readlines()
-        err = stderr.readlines()
         if internal:
             # For processing, don't display output
-            if err:
+            if err and check:
                 # Show error and abort run
                 err_str = ''.join(err)
                 raise Exception(err_str)
@@ -130,7 +288,7 @@ class Device(object):
             # Display output
             if out: map(lambda x: print('\t%s' % x, end=''), out)
             if err: map(lambda x: print('\t%s%s%s' % (Colors.R, x, Colors.N), end=''), err)
-        return out, err
+        return out, err, status
 
     # ==================================================================================================================
     # UTILS - AGENT
@@ -138,14 +296,7 @@ class Device(object):
     def _portforward_agent_start(self):
         """Setup local port forward to enable communication with the Needle server running on the device."""
         self.printer.debug('{} Setting up port forwarding on port {}'.format(Constants.AGENT_TAG, self._agent_port))
-        localhost = '127.0.0.1'
-        self._port_forward_agent = SSHTunnelForwarder(
-            (self._ip, int(self._port)),
-            ssh_username=self._username,
-            ssh_password=self._password,
-            local_bind_address=(localhost, self._agent_port),
-            remote_bind_address=(localhost, self._agent_port),
-        )
+        self._port_forward_agent = PortForward(self._transport(), self._agent_port, self._agent_port, tag=Constants.AGENT_TAG)
         self._port_forward_agent.start()
 
     def _portforward_agent_stop(self):
@@ -153,11 +304,12 @@ class Device(object):
         self.printer.debug('{} Stopping port forwarding'.format(Constants.AGENT_TAG))
         if self._port_forward_agent:
             self._port_forward_agent.stop()
+            self._port_forward_agent = None
 
     def _connect_agent(self):
         self.agent.connect()
-        # Ensure the tunnel has been established (especially after auto-reconnecting)
-        self.agent.exec_command_agent(Constants.AGENT_CMD_OS_VERSION)
+        # Ensure the tunnel has been established (especially after auto-reconnecting). Keep the answer for setup()
+        self._ios_version = self.agent.client.send_to_device(Constants.AGENT_CMD_OS_VERSION).strip()
 
     def _disconnect_agent(self):
         self.agent.disconnect()
@@ -168,14 +320,7 @@ class Device(object):
     def _portforward_frida_start(self):
         """Setup local port forward to enable communication with the Frida server running on the device."""
         self.printer.debug('{} Setting up port forwarding on port {}'.format("[FRIDA]", Constants.FRIDA_PORT))
-        localhost = '127.0.0.1'
-        self._frida_server = SSHTunnelForwarder(
-            (self._ip, int(self._port)),
-            ssh_username=self._username,
-            ssh_password=self._password,
-            local_bind_address=(localhost, Constants.FRIDA_PORT),
-            remote_bind_address=(localhost, Constants.FRIDA_PORT),
-        )
+        self._frida_server = PortForward(self._transport(), Constants.FRIDA_PORT, Constants.FRIDA_PORT, tag="[FRIDA]")
         self._frida_server.start()
 
     def _portforward_frida_stop(self):
@@ -183,17 +328,35 @@ class Device(object):
         self.printer.debug('{} Stopping port forwarding'.format("FRIDA"))
         if self._frida_server:
             self._frida_server.stop()
+            self._frida_server = None
 
     # ==================================================================================================================
     # UTILS - OS
     # ==================================================================================================================
     def _list_apps(self, hide_system_apps=False):
         """Retrieve all the 3rd party apps installed on the device."""
-        agent_list = self.agent.exec_command_agent(Constants.AGENT_CMD_LIST_APPS)
-        self._applist = Utils.string_to_json(agent_list)
+        # Use the list prefetched by setup(), if any
+        future, self._applist_future = self._applist_future, None
+        agent_list = None
+        if future:
+            try:
+                agent_list = future.result()
+            except Exception as e:
+                self.printer.debug('{} Prefetch of the list of apps failed: {}'.format(Constants.AGENT_TAG, e))
+        if agent_list is None:
+            agent_list = self.agent.exec_command_agent(Constants.AGENT_CMD_LIST_APPS)
+        # Parse the list only if it changed (cached responses are returned as the very same object)
+        if agent_list is not self._applist_raw:
+            self._applist_raw, self._applist_all = agent_list, Utils.string_to_json(agent_list)
+        self._applist = self._applist_all
         if hide_system_apps:
             self._applist = {k: v for k, v in self._applist.iteritems() if v["BundleType"] == "User"}
 
+    def apps_changed(self):
+        """To be called after installing/removing software on the device: drop any cached list of apps."""
+        self.agent.cache_invalidate(Constants.AGENT_CMD_LIST_APPS)
+        self._applist, self._applist_future = None, None
+
     def select_target_app(self):
         """List all apps installed and let the user choose which one to target."""
         # Show menu to user
@@ -208,39 +371,140 @@ class Device(object):
         """Returns true if using SSH over USB."""
         return self._ip == '127.0.0.1' or self._ip == 'localhost'
 
+    def _timed(self, leg, func):
+        """Run one leg of the connection, recording how long it took."""
+        start = time.time()
+        try:
+            return func()
+        finally:
+            self.connect_timings[leg] = time.time() - start
+            self.printer.debug('[CONNECT] {}: {:.3f}s'.format(leg, self.connect_timings[leg]))
+
+    def _concurrently(self, *legs):
+        """Run independent legs of the connection in parallel, then re-raise the first error (if any)."""
+        errors = []
+
+        def run(leg):
+            try:
+                leg()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(name='connect', target=run, args=(leg,)) for leg in legs]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        if errors: raise errors[0]
+
+    def _warmup_ssh(self):
+        """Open the SFTP session (and the persistent shell) ahead of the first command. Failures are not fatal."""
+        try:
+            self._timed('sftp', self._get_sftp)
+            if self.persistent_shell: self._timed('shell', self._get_shell)
+        except Exception as e:
+            self.printer.debug('[SSH] Warm-up failed, channels will be opened on first use: %s' % e)
+
     def connect(self):
-        """Connect to the device (both SSH and AGENT)."""
-        # Using USB, setup port forwarding first
+        """Connect to the device (both SSH and AGENT). Independent legs are brought up concurrently."""
+        start = time.time()
+        self.connect_timings = {}
+
+        def ssh_leg():
+            # A single Transport is shared by commands, file transfers and port forwards
+            self.ssh = self._timed('ssh', self._connect_ssh)
+
+        def agent_leg():
+            # Using USB, the agent is reached through the SSH Transport
+            if self.is_usb(): self._timed('agent_forward', self._portforward_agent_start)
+            self._timed('agent', self._connect_agent)
+
         if self.is_usb():
-            self._portforward_usb_start()
-            self._portforward_agent_start()
-        # Setup channels
-        self._connect_agent()
-        self.ssh = self._connect_ssh()
+            # Using USB, setup port forwarding first: everything else goes through it
+            self._timed('usb', self._portforward_usb_start)
+            ssh_leg()
+            self._concurrently(agent_leg, self._warmup_ssh)
+        else:
+            self._concurrently(lambda: (ssh_leg(), self._warmup_ssh()), agent_leg)
+        self.printer.debug('[CONNECT] Connected in {:.3f}s'.format(time.time() - start))
+
+    def _ssh_alive(self):
+        """True if the SSH Transport is up, and can still send messages."""
+        transport = self.ssh.get_transport() if self.ssh else None
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def is_alive(self, leg):
+        """Liveness of a leg of the connection: 'ssh' (Transport and persistent shell), 'agent' or 'frida'."""
+        if leg == 'ssh':
+            return self._ssh_alive() and (self._shell is None or self._shell.is_active())
+        if leg == 'agent':
+            return self.agent.is_alive() and (not self.is_usb() or self._ssh_alive())
+        if leg == 'frida':
+            return self._frida_server is not None and self._frida_server.is_running() and self._ssh_alive()
+        raise Exception('Unknown connection leg: %s' % leg)
+
+    def reconnect(self):
+        """Re-establish only the legs of the connection which are down, leaving the healthy ones untouched."""
+        if not self._ssh_alive():
+            self.printer.warning('[SSH] Connection lost, reconnecting...')
+            # Port forwards ride on the Transport, so they have to be rebuilt with it
+            frida = self._frida_server is not None
+            self._portforward_agent_stop()
+            self._portforward_frida_stop()
+            self._disconnect_ssh()
+            if self.is_usb() and (self._port_forward_ssh is None or self._port_forward_ssh.poll() is not None):
+                self._timed('usb', self._portforward_usb_start)
+            self.ssh = self._timed('ssh', self._connect_ssh)
+            if frida: self._portforward_frida_start()
+            if self.is_usb(): self._portforward_agent_start()
+        elif self._shell is not None and not self._shell.is_active():
+            # Only the persistent shell died: it will be reopened on next use
+            self.printer.debug('[SSH] Persistent shell closed')
+            self._shell.close()
+            self._shell = None
+        if not self.agent.is_alive():
+            self.printer.warning('{} Connection lost, reconnecting...'.format(Constants.AGENT_TAG))
+            self._disconnect_agent()
+            if self.is_usb() and self._port_forward_agent is None:
+                self._portforward_agent_start()
+            self._timed('agent', self._connect_agent)
 
     def disconnect(self):
         """Disconnect from the device (both SSH and AGENT)."""
         # Close channels
-        self._disconnect_ssh()
         self._disconnect_agent()
-        # Using USB, stop port forwarding first
+        self._applist_future = None
+        # Port forwards ride on the SSH Transport, stop them before closing it
+        self._portforward_agent_stop()
+        self._portforward_frida_stop()
+        self._disconnect_ssh()
+        # Using USB, stop port forwarding
         if self._port_forward_ssh:
             self._portforward_usb_stop()
-            self._portforward_agent_stop()
 
     def setup(self):
         """Create temp folder, and check if all tools are available"""
+        # Query the agent in the background: OS version, and the list of apps (needed to select the target app).
+        # The list is prefetched once per connection (or after apps_changed()), and consumed by _list_apps()
+        version = self.agent.submit(Constants.AGENT_CMD_OS_VERSION) if not self._ios_version else None
+        if self._applist is None and self._applist_future is None:
+            self._applist_future = self.agent.submit(Constants.AGENT_CMD_LIST_APPS)
         # Setup temp folder
         self.printer.debug("Creating temp folder: %s" % self.TEMP_FOLDER)
         self.remote_op.dir_create(self.TEMP_FOLDER)
         # Detect OS version
-        if not self._ios_version:
-            self._ios_version = self.agent.exec_command_agent(Constants.AGENT_CMD_OS_VERSION).strip()
+        if version:
+            self._ios_version = version.result().strip()
 
     def cleanup(self):
         """Remove temp folder from device."""
         self.printer.debug("Cleaning up remote temp folder: %s" % self.TEMP_FOLDER)
         self.remote_op.dir_delete(self.TEMP_FOLDER)
+        self.printer.debug("Remote stat cache: {hits} hits, {misses} misses".format(**self.remote_op.cache_stats()))
+        self.printer.debug("Local pull cache: {hits} hits, {misses} misses".format(**self.pull_cache.stats()))
 
     def shell(self):
         """Spawn a system shell on the device."""
@@ -251,12 +515,14 @@ class Device(object):
                                                                                                 ip=self._ip)
         self.local_op.command_interactive(cmd)
 
-    def pull(self, src, dst):
-        """Pull a file from the device."""
+    def pull(self, src, dst, resumable=False):
+        """Pull a file from the device. Use `resumable` for large files, to survive connection drops."""
         self.printer.info("Pulling: %s -> %s" % (src, dst))
-        self.remote_op.download(src, dst)
+        if resumable: self.remote_op.download_resumable(src, dst)
+        else: self.remote_op.download_cached(src, dst)
 
-    def push(self, src, dst):
-        """Push a file on the device."""
+    def push(self, src, dst, resumable=False):
+        """Push a file on the device. Use `resumable` for large files, to survive connection drops."""
         self.printer.info("Pushing: %s -> %s" % (src, dst))
-        self.remote_op.upload(src, dst)
\ No newline at end of file
+        if resumable: self.remote_op.upload_resumable(src, dst)
+        else: self.remote_op.upload(src, dst)
\ No newline at end of file
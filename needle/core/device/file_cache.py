@@ -0,0 +1,100 @@
+import os
+import shutil
+import hashlib
+import threading
+
+from ..utils.constants import Constants
+
+
+# ======================================================================================================================
+# LOCAL CACHE OF PULLED FILES
+# ======================================================================================================================
+class FileCache(object):
+    """Local, content-addressed cache of the files pulled from the device, shared by all the modules.
+
+    Entries are keyed by (device, remote path, size, mtime), so a file is served from the cache only as long as it
+    has not changed on the device. The least recently used entries are evicted to keep the cache under `budget` bytes.
+    """
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    def __init__(self, folder, budget):
+        self._folder = folder
+        self._lock = threading.Lock()
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(self._folder):
+            os.makedirs(self._folder)
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    @staticmethod
+    def key(device_id, path, size, mtime):
+        """Build the key of a remote file."""
+        return hashlib.sha1('\0'.join([device_id, path, str(size), str(int(mtime))])).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self._folder, key)
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in its budget."""
+        entries = []
+        for name in os.listdir(self._folder):
+            path = os.path.join(self._folder, name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.budget: break
+            os.remove(path)
+            total -= size
+
+    # ==================================================================================================================
+    # EXPOSED COMMANDS
+    # ==================================================================================================================
+    def enabled(self):
+        return self.budget > 0
+
+    def get(self, key, dst):
+        """Place a copy of the cached entry at `dst` (hard linked if PULL_CACHE_LINK is set). Returns False on a miss."""
+        src = self._entry(key)
+        with self._lock:
+            if not os.path.isfile(src):
+                self.misses += 1
+                return False
+            self.hits += 1
+            # Mark as recently used
+            os.utime(src, None)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            if Constants.PULL_CACHE_LINK:
+                try:
+                    os.link(src, dst)
+                    return True
+                except OSError:
+                    pass
+            shutil.copyfile(src, dst)
+        return True
+
+    def put(self, key, src):
+        """Store a copy of the local file `src` under `key`, then enforce the budget."""
+        if os.path.getsize(src) > self.budget: return
+        dst = self._entry(key)
+        tmp = '{}.tmp{}'.format(dst, threading.current_thread().ident)
+        with self._lock:
+            shutil.copyfile(src, tmp)
+            os.rename(tmp, dst)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self._folder):
+                os.remove(os.path.join(self._folder, name))
+            self.hits, self.misses = 0, 0
+
+    def stats(self):
+        size = sum(os.path.getsize(os.path.join(self._folder, name)) for name in os.listdir(self._folder))
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(os.listdir(self._folder)), 'size': size}
@@ -0,0 +1,89 @@
+import time
+import fnmatch
+import posixpath
+import collections
+
+from ..utils.constants import Constants
+from ..utils.utils import Utils
+
+
+ManifestEntry = collections.namedtuple('ManifestEntry', ['path', 'size', 'mtime', 'type'])
+
+
+# ======================================================================================================================
+# APP MANIFEST
+# ======================================================================================================================
+class AppManifest(object):
+    """Index of the content of the app's bundle and data containers, built with a single remote walk.
+
+    Storage modules query it (by glob, extension, size) instead of running their own find.
+    Data Protection classes are retrieved on demand, and remembered for the following queries.
+    """
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    def __init__(self, device, app_metadata):
+        self._device = device
+        self._dirs = [app_metadata['bundle_directory'], app_metadata['data_directory']]
+        self._entries = []
+        self._dataprotection = {}
+        self.timestamp = None
+
+    # ==================================================================================================================
+    # BUILD
+    # ==================================================================================================================
+    def build(self):
+        """Walk the containers once, recording type, size and modification time of every entry."""
+        self._device.printer.verbose("Indexing the app's containers...")
+        cmd = '''{bin} {dirs} -printf '%y\\t%s\\t%T@\\t%p\\n' '''.format(bin=self._device.DEVICE_TOOLS['FIND'],
+                                                                       dirs=' '.join(self._dirs))
+        entries = []
+        for line in self._device.remote_op.command_stream(cmd, write=False):
+            try:
+                kind, size, mtime, path = line.rstrip('\n').split('\t', 3)
+                entries.append(ManifestEntry(path, int(size), float(mtime), kind))
+            except ValueError:
+                self._device.printer.debug('Skipping unexpected line while indexing: {}'.format(line.strip()))
+        self._entries = entries
+        self._dataprotection = {}
+        self.timestamp = time.time()
+        self._device.printer.debug('Indexed {} entries'.format(len(entries)))
+        return self
+
+    def is_fresh(self):
+        """True if the manifest has been built less than MANIFEST_TTL seconds ago."""
+        return self.timestamp is not None and time.time() - self.timestamp < Constants.MANIFEST_TTL
+
+    # ==================================================================================================================
+    # QUERY
+    # ==================================================================================================================
+    def entries(self, patterns=None, extensions=None, min_size=None, max_size=None, kind='f'):
+        """Return the entries matching all the given filters:
+            - patterns: list of globs, matched against the file name
+            - extensions: list of extensions (without the dot)
+            - min_size/max_size: in bytes
+            - kind: 'f' for files, 'd' for folders, None for any type
+        """
+        res = []
+        for e in self._entries:
+            if kind and e.type != kind: continue
+            name = posixpath.basename(e.path)
+            if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns): continue
+            if extensions and posixpath.splitext(name)[1].lstrip('.') not in extensions: continue
+            if min_size is not None and e.size < min_size: continue
+            if max_size is not None and e.size > max_size: continue
+            res.append(e)
+        return res
+
+    def files(self, **kwargs):
+        """Same as entries(), but only return the paths."""
+        return [e.path for e in self.entries(**kwargs)]
+
+    def dataprotection(self, paths):
+        """Return a list of (escaped path, data protection class), in the same format of App.get_dataprotection.
+        Classes not retrieved yet are fetched in one go, then remembered."""
+        missing = [p for p in paths if p not in self._dataprotection]
+        if missing:
+            for path, (fname, cl) in zip(missing, self._device.app.get_dataprotection(missing)):
+                self._dataprotection[path] = cl
+        return [(Utils.escape_path(p), self._dataprotection[p]) for p in paths]
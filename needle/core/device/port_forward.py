@@ -0,0 +1,110 @@
+import socket
+import select
+import threading
+
+from ..utils.constants import Constants
+from ..utils.printer import Printer
+
+
+# ======================================================================================================================
+# PORT FORWARD
+# ======================================================================================================================
+class PortForward(object):
+    """Local port forward carried by direct-tcpip channels of an already authenticated Paramiko Transport.
+
+    Every connection accepted on the local port gets its own channel on the shared Transport,
+    so no additional SSH handshake is needed to reach the Agent or the Frida server.
+    """
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    def __init__(self, transport, local_port, remote_port, local_host='127.0.0.1', remote_host='127.0.0.1', tag=''):
+        self._transport = transport
+        self._local = (local_host, int(local_port))
+        self._remote = (remote_host, int(remote_port))
+        self._tag = tag
+        self._server = None
+        self._thread = None
+        self._active = []
+        self._lock = threading.Lock()
+        self._running = False
+        self.printer = Printer()
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    def _accept_loop(self):
+        """Accept local connections and hand each one to a forwarding thread."""
+        while self._running:
+            try:
+                client, addr = self._server.accept()
+            except socket.error:
+                # Listening socket closed by stop()
+                break
+            t = threading.Thread(name='forward', target=self._forward, args=(client, addr))
+            t.setDaemon(True)
+            t.start()
+
+    def _forward(self, client, addr):
+        """Open a direct-tcpip channel for the given local connection, then pump data both ways until one end closes."""
+        try:
+            chan = self._transport.open_channel('direct-tcpip', self._remote, addr)
+        except Exception as e:
+            self.printer.debug('{} Could not open forwarding channel to {}: {}'.format(self._tag, self._remote, e))
+            client.close()
+            return
+        with self._lock:
+            self._active.append((client, chan))
+        try:
+            while True:
+                r, w, x = select.select([client, chan], [], [])
+                if client in r:
+                    data = client.recv(Constants.SSH_RECV_BUFFER)
+                    if not data: break
+                    chan.sendall(data)
+                if chan in r:
+                    data = chan.recv(Constants.SSH_RECV_BUFFER)
+                    if not data: break
+                    client.sendall(data)
+        except (socket.error, EOFError):
+            pass
+        finally:
+            with self._lock:
+                if (client, chan) in self._active:
+                    self._active.remove((client, chan))
+            chan.close()
+            client.close()
+
+    # ==================================================================================================================
+    # EXPOSED COMMANDS
+    # ==================================================================================================================
+    def is_running(self):
+        """True if the forward is accepting connections."""
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Bind the local port and start accepting connections."""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(self._local)
+        self._server.listen(5)
+        self._running = True
+        self._thread = threading.Thread(name='portforward', target=self._accept_loop)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop accepting connections and close any forwarded connection still open."""
+        self._running = False
+        if self._server:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self._server.close()
+            self._server = None
+        with self._lock:
+            active, self._active = self._active, []
+        for client, chan in active:
+            chan.close()
+            client.close()
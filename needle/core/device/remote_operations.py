@@ -1,10 +1,22 @@
+from __future__ import print_function
 import os
+import json
+import stat
 import time
+import socket
+import hashlib
+import tarfile
+import posixpath
 import threading
+import collections
 import subprocess
+import Queue
+import paramiko
 
 from ..utils.constants import Constants
-from ..utils.utils import Utils
+from ..utils.metrics import Metrics
+from ..utils.printer import Colors
+from ..utils.utils import Utils, Retry
 
 
 class RemoteOperations(object):
@@ -13,86 +25,258 @@ class RemoteOperations(object):
     # ==================================================================================================================
     def __init__(self, device):
         self._device = device
+        # Stat cache: (kind, path) -> (timestamp, value)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self.cache_hits, self.cache_misses = 0, 0
+
+    # ==================================================================================================================
+    # STAT CACHE
+    # ==================================================================================================================
+    @staticmethod
+    def _cache_path(path):
+        """Normalize a (possibly escaped) path, to be used as cache key."""
+        return posixpath.normpath(Utils.unescape_path(path))
+
+    def _cache_get(self, kind, path):
+        """Return the cached value, or None if missing or older than the TTL."""
+        key = (kind, self._cache_path(path))
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry and time.time() - entry[0] < Constants.REMOTE_CACHE_TTL:
+                self.cache_hits += 1
+                return entry[1]
+            self.cache_misses += 1
+            return None
+
+    def _cache_set(self, kind, path, value):
+        with self._cache_lock:
+            self._cache[(kind, self._cache_path(path))] = (time.time(), value)
+
+    def cache_invalidate(self, *paths):
+        """Drop the cached entries affected by a change to the given paths:
+        the paths themselves, their content, and the listings of the folders containing them."""
+        with self._cache_lock:
+            for path in map(self._cache_path, paths):
+                prefix = path.rstrip('/') + '/'
+                for key in self._cache.keys():
+                    kind, cached = key
+                    if cached == path or cached.startswith(prefix):
+                        del self._cache[key]
+                    elif kind.startswith('dir_list') and path.startswith(cached.rstrip('/') + '/'):
+                        del self._cache[key]
+
+    def cache_clear(self):
+        """Drop all the cached entries (e.g., after a command which might have changed anything on the filesystem)."""
+        with self._cache_lock:
+            self._cache = {}
+
+    def cache_stats(self):
+        """Return hits, misses and number of entries of the stat cache."""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'entries': len(self._cache)}
 
     # ==================================================================================================================
     # FILES
     # ==================================================================================================================
     def file_exist(self, path):
-        path = Utils.escape_path(path)
-        cmd = 'if [ -f %s ]; then echo "yes"; else echo "no" ; fi' % path
-        out = self.command_blocking(cmd, internal=True)
-        res = out[0] if type(out) is list else out
-        if res.strip() == "yes": return True
-        else: return False
+        cached = self._cache_get('file_exist', path)
+        if cached is not None: return cached
+        res = self._test_path('-f', path)
+        self._cache_set('file_exist', path, res)
+        return res
 
     def file_create(self, path):
-        path = Utils.escape_path(path)
-        if not self.file_exist(path):
-            cmd = 'touch %s' % path
-            self.command_blocking(cmd)
+        if self._cache_get('file_exist', path): return
+        cmd = RemoteBatch.build_op('file_create', path)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(path)
+        self._cache_set('file_exist', path, True)
 
     def file_delete(self, path):
-        path = Utils.escape_path(path)
-        if self.file_exist(path):
-            cmd = 'rm %s 2> /dev/null' % path
-            self.command_blocking(cmd)
+        if self._cache_get('file_exist', path) is False: return
+        cmd = RemoteBatch.build_op('file_delete', path)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(path)
+        self._cache_set('file_exist', path, False)
 
     def file_copy(self, src, dst):
-        src, dst = Utils.escape_path(src), Utils.escape_path(dst)
-        cmd = "cp {} {}".format(src, dst)
-        self.command_blocking(cmd)
+        cmd = RemoteBatch.build_op('file_copy', src, dst)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(dst)
 
     def file_move(self, src, dst):
-        src, dst = Utils.escape_path(src), Utils.escape_path(dst)
-        cmd = "mv {} {}".format(src, dst)
-        self.command_blocking(cmd)
+        cmd = RemoteBatch.build_op('file_move', src, dst)
+        self.command_blocking(cmd, write=False)
+        self.cache_invalidate(src, dst)
 
     # ==================================================================================================================
     # DIRECTORIES
     # ==================================================================================================================
-    def dir_exist(self, path):
+    def _test_path(self, flag, path):
         path = Utils.escape_path(path)
-        cmd = 'if [ -d %s ]; then echo "yes"; else echo "no" ; fi' % path
-        out = self.command_blocking(cmd, internal=True)
+        cmd = 'if [ %s %s ]; then echo "yes"; else echo "no" ; fi' % (flag, path)
+        out = self.command_blocking(cmd, internal=True, write=False, idempotent=True)
         res = out[0] if type(out) is list else out
         if res.strip() == "yes": return True
         else: return False
 
+    def dir_exist(self, path):
+        cached = self._cache_get('dir_exist', path)
+        if cached is not None: return cached
+        res = self._test_path('-d', path)
+        self._cache_set('dir_exist', path, res)
+        return res
+
     def dir_create(self, path):
-        path = Utils.escape_path(path)
-        if not self.dir_exist(path):
-            cmd = 'mkdir %s' % path
-            self.command_blocking(cmd)
+        if self._cache_get('dir_exist', path): return
+        cmd = RemoteBatch.build_op('dir_create', path)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(path)
+        self._cache_set('dir_exist', path, True)
 
     def dir_delete(self, path, force=False):
-        def delete(path):
-            cmd = 'rm -rf %s 2> /dev/null' % path
-            self.command_blocking(cmd)
-        path = Utils.escape_path(path)
-        if force: delete(path)
-        elif self.dir_exist(path): delete(path)
+        # rm -rf is a no-op on missing folders, no need to check first
+        if force: cmd = 'rm -rf %s 2> /dev/null' % Utils.escape_path(path)
+        else: cmd = RemoteBatch.build_op('dir_delete', path)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(path)
 
     def dir_list(self, path, recursive=False):
+        kind = 'dir_list_recursive' if recursive else 'dir_list'
+        cached = self._cache_get(kind, path)
+        if cached is not None: return list(cached)
         if not self.dir_exist(path):
             return None
         path = Utils.escape_path(path)
         opts = '-aR' if recursive else ''
         cmd = 'ls {opts} {path}'.format(opts=opts, path=path)
-        file_list = self.command_blocking(cmd)
-        return map(lambda x: x.strip(), file_list)
+        file_list = self.command_blocking(cmd, write=False, idempotent=True)
+        res = map(lambda x: x.strip(), file_list)
+        self._cache_set(kind, path, res)
+        return list(res)
 
     def dir_reset(self, path):
-        if self.dir_exist(path): self.dir_delete(path)
-        self.dir_create(path)
+        cmd = RemoteBatch.build_op('dir_reset', path)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(path)
+        self._cache_set('dir_exist', path, True)
+
+    # ==================================================================================================================
+    # BATCH
+    # ==================================================================================================================
+    def batch(self):
+        """Return a new RemoteBatch: queue filesystem operations, then run them all in a single round trip."""
+        return RemoteBatch(self)
 
     # ==================================================================================================================
     # COMMANDS
     # ==================================================================================================================
-    def command_blocking(self, cmd, internal=True):
-        """Run a blocking command: wait for its completion before resuming execution."""
+    @staticmethod
+    def _metrics_name(cmd):
+        """Group remote commands by the tool they run."""
+        parts = cmd.split()
+        return posixpath.basename(parts[0]) if parts else cmd
+
+    def command_blocking(self, cmd, internal=True, timeout=None, use_shell=True, write=True, idempotent=False):
+        """Run a blocking command: wait for its completion (or for `timeout` seconds) before resuming execution.
+        Any command might change the filesystem, so the stat cache is dropped: unset `write` only for commands known
+        to be read-only (or whose changes are invalidated by the caller).
+        Commands are not re-run after a connection failure, unless marked as safe to repeat with `idempotent`."""
+        self._device.printer.debug('[REMOTE CMD] Remote Command: %s' % cmd)
+        if write: self.cache_clear()
+        with Metrics().measure('remote', self._metrics_name(cmd), bytes_out=len(cmd), detail=cmd) as m:
+            out, err, status = self._device._exec_command_ssh(cmd, internal, timeout=timeout, use_shell=use_shell,
+                                                              idempotent=idempotent)
+            if type(out) is tuple: out = out[0]
+            m['bytes_in'] = sum(len(x) for x in out) + sum(len(x) for x in err)
+        return out
+
+    def command_status(self, cmd, timeout=None, idempotent=False, write=True):
+        """Run a blocking command, and return its (stdout, stderr, exit status) without raising on STDERR output.
+        The exit status is None if the command did not complete within the timeout. See command_blocking for `write`."""
         self._device.printer.debug('[REMOTE CMD] Remote Command: %s' % cmd)
-        out, err = self._device._exec_command_ssh(cmd, internal)
-        if type(out) is tuple: out = out[0]
+        if write: self.cache_clear()
+        with Metrics().measure('remote', self._metrics_name(cmd), bytes_out=len(cmd), detail=cmd) as m:
+            out, err, status = self._device._exec_command_ssh(cmd, True, timeout=timeout, check=False,
+                                                              idempotent=idempotent)
+            m['bytes_in'] = sum(len(x) for x in out) + sum(len(x) for x in err)
+        return out, err, status
+
+    def command_stream(self, cmd, raw=False, timeout=None, write=True):
+        """Run a command and iterate over its output as it is produced: lines (or raw chunks, if `raw` is True).
+        Nothing is accumulated in memory, and the remote command is paused while the consumer is busy.
+        See command_blocking for `write`."""
+        self._device.printer.debug('[REMOTE CMD] Remote Streaming Command: %s' % cmd)
+        if write: self.cache_clear()
+        if timeout is None:
+            timeout = Constants.SSH_COMMAND_TIMEOUT
+        return self._stream_measured(cmd, self._device._stream_command_channel(cmd, timeout, raw=raw))
+
+    def _stream_measured(self, cmd, stream):
+        """Record a streaming command in the metrics, from its start until the stream is exhausted (or closed early)."""
+        with Metrics().measure('remote', self._metrics_name(cmd), bytes_out=len(cmd), detail=cmd) as m:
+            try:
+                for data in stream:
+                    m['bytes_in'] += len(data)
+                    yield data
+            except GeneratorExit:
+                # The consumer stopped early: not a failure
+                pass
+            finally:
+                stream.close()
+
+    def command_many(self, cmds, max_parallel=Constants.SSH_MAX_PARALLEL, internal=True, timeout=None, write=True):
+        """Run independent commands concurrently, each on its own channel of the SSH Transport.
+
+        Returns the output of each command (as command_blocking would), in the same order of `cmds`.
+        Commands failing because of a channel error are re-run sequentially with command_blocking.
+        See command_blocking for `write`.
+        """
+        if write: self.cache_clear()
+        if timeout is None:
+            timeout = Constants.SSH_COMMAND_TIMEOUT
+        results = [None] * len(cmds)
+        failed = []
+        queue = Queue.Queue()
+        for i, cmd in enumerate(cmds):
+            queue.put((i, cmd))
+
+        def worker():
+            while True:
+                try:
+                    i, cmd = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                self._device.printer.debug('[REMOTE CMD] Remote Command (parallel): %s' % cmd)
+                try:
+                    with Metrics().measure('remote', self._metrics_name(cmd), bytes_out=len(cmd), detail=cmd) as m:
+                        results[i] = self._device._exec_command_channel(cmd, timeout)
+                        m['bytes_in'] = sum(len(x) for x in results[i][0]) + sum(len(x) for x in results[i][1])
+                except Exception as e:
+                    self._device.printer.debug('[REMOTE CMD] Parallel command failed ({}), will retry: {}'.format(e, cmd))
+                    failed.append(i)
+
+        # Run the commands on a pool of channels
+        workers = [threading.Thread(name='command_many', target=worker) for _ in range(min(max_parallel, len(cmds)))]
+        for w in workers:
+            w.setDaemon(True)
+            w.start()
+        for w in workers:
+            w.join()
+
+        # Collect the output in input order
+        out = []
+        for i, cmd in enumerate(cmds):
+            if i in failed:
+                out.append(self.command_blocking(cmd, internal=internal, timeout=timeout, use_shell=False, write=write))
+                continue
+            stdout, stderr, status = results[i]
+            if internal and stderr:
+                raise Exception(''.join(stderr))
+            if not internal:
+                if stdout: map(lambda x: print('\t%s' % x, end=''), stdout)
+                if stderr: map(lambda x: print('\t%s%s%s' % (Colors.R, x, Colors.N), end=''), stderr)
+            out.append(stdout)
         return out
 
     def command_interactive(self, cmd):
@@ -128,7 +312,8 @@ class RemoteOperations(object):
             """Daemon used to run the command so to avoid blocking the UI"""
             # Run command
             cmd += ' & echo $!'
-            out = self.command_blocking(cmd)
+            # Background processes keep the output streams open: never run them in the persistent shell
+            out = self.command_blocking(cmd, timeout=Constants.SSH_BACKGROUND_TIMEOUT, use_shell=False)
             # Parse PID of the process
             try:
                 pid = out[0].strip()
@@ -159,36 +344,429 @@ class RemoteOperations(object):
     # ==================================================================================================================
     # DOWNLOAD/UPLOAD
     # ==================================================================================================================
-    def download(self, src, dst, recursive=False):
-        """Download a file from the device."""
-        src, dst = Utils.escape_path_scp(src), Utils.escape_path(dst)
-        self._device.printer.debug("Downloading: %s -> %s" % (src, dst))
-
-        cmd = 'sshpass -p "{password}" scp {hostverification} -P {port}'.format(password=self._device._password,
-                                                                                hostverification=Constants.DISABLE_HOST_VERIFICATION,
-                                                                                port=self._device._port)
-        if recursive: cmd += ' -r'
-        cmd += ' {username}@{ip}:{src} {dst}'.format(username=self._device._username,
-                                                    ip=self._device._ip,
-                                                    src=src, dst=dst)
-
-        self._device.local_op.command_blocking(cmd)
+    def _transfer_report(self, direction, nbytes, nfiles, start):
+        """Log size and throughput of a completed transfer."""
+        elapsed = max(time.time() - start, 0.001)
+        self._device.printer.debug("{} {} bytes ({} files) in {:.2f}s ({:.1f} KB/s, {:.1f} files/s)".format(
+            direction, nbytes, nfiles, elapsed, nbytes / elapsed / 1024, nfiles / elapsed))
+
+    def _sftp_get_file(self, sftp, src, dst, size, callback=None):
+        """Pipelined download of a single file: all the read requests are issued upfront with prefetch."""
+        done = 0
+        with sftp.open(src, 'rb') as fr:
+            fr.prefetch(size)
+            with open(dst, 'wb') as fw:
+                while True:
+                    data = fr.read(Constants.SFTP_CHUNK_SIZE)
+                    if not data: break
+                    fw.write(data)
+                    done += len(data)
+                    if callback: callback(src, done, size)
+        return done
+
+    def _sftp_put_file(self, sftp, src, dst, callback=None):
+        """Pipelined upload of a single file: writes are not acknowledged one by one."""
+        size, done = os.path.getsize(src), 0
+        with open(src, 'rb') as fr:
+            with sftp.open(dst, 'wb') as fw:
+                fw.set_pipelined(True)
+                while True:
+                    data = fr.read(Constants.SFTP_CHUNK_SIZE)
+                    if not data: break
+                    fw.write(data)
+                    done += len(data)
+                    if callback: callback(src, done, size)
+        return done
+
+    def _sftp_download(self, src, dst, recursive, callback):
+        sftp = self._device._get_sftp()
+        attr = sftp.stat(src)
+        # Same semantic of scp: if the destination is a folder, copy inside it
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, posixpath.basename(src.rstrip('/')))
+        if not stat.S_ISDIR(attr.st_mode):
+            return self._sftp_get_file(sftp, src, dst, attr.st_size, callback), 1
+        if not recursive:
+            raise Exception('{} is a directory, use recursive=True'.format(src))
+        nbytes, nfiles = 0, 0
+        stack = [(src, dst)]
+        while stack:
+            rdir, ldir = stack.pop()
+            if not os.path.isdir(ldir): os.makedirs(ldir)
+            for entry in sftp.listdir_attr(rdir):
+                rpath, lpath = posixpath.join(rdir, entry.filename), os.path.join(ldir, entry.filename)
+                if stat.S_ISDIR(entry.st_mode):
+                    stack.append((rpath, lpath))
+                elif stat.S_ISREG(entry.st_mode):
+                    nbytes += self._sftp_get_file(sftp, rpath, lpath, entry.st_size, callback)
+                    nfiles += 1
+        return nbytes, nfiles
+
+    def _sftp_upload(self, src, dst, recursive, callback):
+        sftp = self._device._get_sftp()
+        # Same semantic of scp: if the destination is a folder, copy inside it
+        try:
+            if stat.S_ISDIR(sftp.stat(dst).st_mode):
+                dst = posixpath.join(dst, os.path.basename(src.rstrip(os.sep)))
+        except IOError:
+            pass
+        if not os.path.isdir(src):
+            return self._sftp_put_file(sftp, src, dst, callback), 1
+        if not recursive:
+            raise Exception('{} is a directory, use recursive=True'.format(src))
+        nbytes, nfiles = 0, 0
+        for root, dirs, files in os.walk(src):
+            rel = os.path.relpath(root, src)
+            rdir = dst if rel == os.curdir else posixpath.join(dst, rel.replace(os.sep, '/'))
+            try:
+                sftp.mkdir(rdir)
+            except IOError:
+                # Folder already exists
+                pass
+            for f in files:
+                nbytes += self._sftp_put_file(sftp, os.path.join(root, f), posixpath.join(rdir, f), callback)
+                nfiles += 1
+        return nbytes, nfiles
+
+    def _tar_download(self, src, dst, compress, callback):
+        """Pull a whole folder in a single stream: tar runs on the device, and the archive is extracted locally on the fly."""
+        sftp = self._device._get_sftp()
+        if not stat.S_ISDIR(sftp.stat(src).st_mode):
+            return None
+        # Same semantic of scp: if the destination is a folder, copy inside it
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, posixpath.basename(src.rstrip('/')))
+        cmd = '{bin} -c{z}f - -C {src} . 2> /dev/null'.format(bin=self._device.DEVICE_TOOLS['TAR'],
+                                                               z='z' if compress else '',
+                                                               src=Utils.escape_path(src))
+        self._device.printer.debug('[REMOTE CMD] Remote Streaming Command: %s' % cmd)
+        stdin, stdout, stderr = self._device.ssh.exec_command(cmd, bufsize=Constants.SFTP_CHUNK_SIZE)
+        stream = _CountingStream(stdout)
+        nfiles = 0
+        try:
+            archive = tarfile.open(fileobj=stream, mode='r|gz' if compress else 'r|')
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+            root = os.path.realpath(dst)
+            inside = lambda path: os.path.realpath(path) == root or os.path.realpath(path).startswith(root + os.sep)
+            for member in archive:
+                # Never write outside of the destination folder, neither directly nor through a link
+                path = os.path.join(dst, member.name)
+                if member.issym():
+                    target = os.path.join(os.path.dirname(path), member.linkname)
+                elif member.islnk():
+                    target = os.path.join(dst, member.linkname)
+                else:
+                    target = path
+                if os.path.isabs(member.name) or not inside(path) or not inside(target):
+                    self._device.printer.warning('Skipping suspicious path in archive: {}'.format(member.name))
+                    continue
+                archive.extract(member, dst)
+                if member.isfile():
+                    nfiles += 1
+                    if callback: callback(member.name, stream.count, None)
+            archive.close()
+        except tarfile.TarError as e:
+            stdout.channel.close()
+            self._device.printer.debug('Streaming with tar failed ({}), falling back to SFTP'.format(e))
+            return None
+        if stdout.channel.recv_exit_status() != 0:
+            self._device.printer.debug('Streaming with tar failed (exit status), falling back to SFTP')
+            return None
+        return stream.count, nfiles
 
-    def upload(self, src, dst, recursive=True):
-        """Upload a file on the device."""
-        src, dst = Utils.escape_path_scp(src), Utils.escape_path_scp(dst)
+    def _tar_upload(self, src, dst, compress, callback):
+        """Push a whole local folder in a single stream: the archive is built on the fly and extracted by tar on the device."""
+        if not os.path.isdir(src):
+            return None
+        # Same semantic of scp: if the destination is a folder, copy inside it
+        sftp = self._device._get_sftp()
+        try:
+            if stat.S_ISDIR(sftp.stat(dst).st_mode):
+                dst = posixpath.join(dst, os.path.basename(src.rstrip(os.sep)))
+        except IOError:
+            pass
+        dst = Utils.escape_path(dst)
+        cmd = 'mkdir -p {dst} && {bin} -x{z}f - -C {dst} 2> /dev/null'.format(bin=self._device.DEVICE_TOOLS['TAR'],
+                                                                              z='z' if compress else '',
+                                                                              dst=dst)
+        self._device.printer.debug('[REMOTE CMD] Remote Streaming Command: %s' % cmd)
+        stdin, stdout, stderr = self._device.ssh.exec_command(cmd, bufsize=Constants.SFTP_CHUNK_SIZE)
+        stream = _CountingStream(stdin)
+        nfiles = 0
+        archive = tarfile.open(fileobj=stream, mode='w|gz' if compress else 'w|')
+        for root, dirs, files in os.walk(src):
+            for f in files:
+                path = os.path.join(root, f)
+                archive.add(path, arcname=os.path.relpath(path, src), recursive=False)
+                nfiles += 1
+                if callback: callback(path, stream.count, None)
+        archive.close()
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        if stdout.channel.recv_exit_status() != 0:
+            raise IOError('tar exited with an error on the device')
+        return stream.count, nfiles
+
+    def _pull_cache_key(self, src):
+        """Key of a remote file in the local pull cache, from an SFTP stat. None for folders and missing files."""
+        path = Utils.unescape_path(src)
+        try:
+            st = self._device._get_sftp().stat(path)
+        except IOError:
+            return None
+        if not stat.S_ISREG(st.st_mode): return None
+        return self._device.pull_cache.key(self._device._fingerprint(), path, st.st_size, st.st_mtime)
+
+    def download_cached(self, src, dst):
+        """Download a file, serving it from the local pull cache if it has not changed on the device since last pulled.
+        Folders (and everything else the cache can not key) are simply downloaded."""
+        cache = self._device.pull_cache
+        key = self._pull_cache_key(src) if cache.enabled() else None
+        if key is None:
+            return self.download(src, dst)
+        local = Utils.unescape_path(dst)
+        if os.path.isdir(local):
+            local = os.path.join(local, posixpath.basename(Utils.unescape_path(src)))
+        with Metrics().measure('transfer', 'pull_cache', detail=src) as m:
+            hit = cache.get(key, local)
+            if hit: m['bytes_in'] = os.path.getsize(local)
+        if hit:
+            self._device.printer.debug("Served from the pull cache: %s -> %s" % (src, local))
+            return
+        self.download(src, dst)
+        cache.put(key, local)
+
+    def file_size(self, path):
+        """Size of a remote file, from an SFTP stat."""
+        return self._device._get_sftp().stat(Utils.unescape_path(path)).st_size
+
+    def open_file(self, path, mode='rb'):
+        """Open a remote file over SFTP: the returned file object is seekable, so only the parts actually read are transferred."""
+        return self._device._get_sftp().open(Utils.unescape_path(path), mode)
+
+    def read_range(self, path, offset, size):
+        """Read (at most) `size` bytes of a remote file, starting at `offset`, without transferring the rest of it."""
+        path = Utils.unescape_path(path)
+        with Metrics().measure('transfer', 'read_range', detail=path) as m:
+            with self._device._get_sftp().open(path, 'rb') as fr:
+                fr.seek(offset)
+                data = fr.read(size)
+            m['bytes_in'] = len(data)
+        return data
+
+    def download(self, src, dst, recursive=False, callback=None, compress=False):
+        """Download a file (or a folder, if recursive) from the device.
+
+        Folders are streamed as a single tar archive (gzipped if `compress` is True) and extracted locally on the fly,
+        falling back to SFTP if tar is not available on the device. Files are transferred over SFTP.
+        `callback`, if provided, is invoked as callback(path, bytes_transferred, bytes_total) while files are copied.
+        """
+        src, dst = Utils.unescape_path(src), Utils.unescape_path(dst)
+        self._device.printer.debug("Downloading: %s -> %s" % (src, dst))
+        start = time.time()
+        with Metrics().measure('transfer', 'download', detail=src) as m:
+            try:
+                res = self._tar_download(src, dst, compress, callback) if recursive else None
+                nbytes, nfiles = res if res else self._sftp_download(src, dst, recursive, callback)
+            except (IOError, OSError) as e:
+                raise Exception('Error while downloading {}: {}'.format(src, e))
+            m['bytes_in'] = nbytes
+        self._transfer_report('Downloaded', nbytes, nfiles, start)
+
+    def upload(self, src, dst, recursive=True, callback=None, compress=False):
+        """Upload a file (or a folder, if recursive) on the device.
+
+        Folders are streamed as a single tar archive (gzipped if `compress` is True), extracted on the device on the fly.
+        Files are transferred over SFTP.
+        `callback`, if provided, is invoked as callback(path, bytes_transferred, bytes_total) while files are copied.
+        """
+        src, dst = Utils.unescape_path(src), Utils.unescape_path(dst)
         self._device.printer.debug("Uploading: %s -> %s" % (src, dst))
+        start = time.time()
+        with Metrics().measure('transfer', 'upload', detail=src) as m:
+            try:
+                res = self._tar_upload(src, dst, compress, callback) if recursive else None
+                nbytes, nfiles = res if res else self._sftp_upload(src, dst, recursive, callback)
+            except (IOError, OSError) as e:
+                raise Exception('Error while uploading {}: {}'.format(src, e))
+            finally:
+                self.cache_invalidate(dst)
+            m['bytes_out'] = nbytes
+        self._transfer_report('Uploaded', nbytes, nfiles, start)
 
-        cmd = 'sshpass -p "{password}" scp {hostverification} -P {port}'.format(password=self._device._password,
-                                                                                hostverification=Constants.DISABLE_HOST_VERIFICATION,
-                                                                                port=self._device._port)
-        if recursive: cmd += ' -r'
-        cmd += ' {src} {username}@{ip}:{dst}'.format(src=src,
-                                                    username=self._device._username,
-                                                    ip=self._device._ip,
-                                                    dst=dst)
-
-        self._device.local_op.command_blocking(cmd)
+    # ==================================================================================================================
+    # RESUMABLE TRANSFERS
+    # ==================================================================================================================
+    def _sidecar_load(self, sidecar, identity):
+        """Return the chunks already transferred, if the sidecar refers to the same transfer (same source, size, mtime)."""
+        try:
+            with open(sidecar, 'r') as fp:
+                state = json.load(fp)
+            if state['identity'] == identity and state['chunk'] == Constants.TRANSFER_CHUNK_SIZE:
+                return set(state['done'])
+        except (IOError, ValueError, KeyError):
+            pass
+        return set()
+
+    def _sidecar_save(self, sidecar, identity, done):
+        """Atomically record the chunks transferred so far."""
+        with open(sidecar + '.tmp', 'w') as fp:
+            json.dump({'identity': identity, 'chunk': Constants.TRANSFER_CHUNK_SIZE, 'done': sorted(done)}, fp)
+        os.rename(sidecar + '.tmp', sidecar)
+
+    def remote_sha256(self, path):
+        """SHA-256 of a file on the device."""
+        cmd = '{bin} {path}'.format(bin=self._device.DEVICE_TOOLS['SHA256SUM'], path=Utils.escape_path(path))
+        out = self.command_blocking(cmd, internal=True, timeout=Constants.TRANSFER_HASH_TIMEOUT, write=False, idempotent=True)
+        return out[0].split()[0].strip()
+
+    def _local_sha256(self, path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(Constants.SFTP_CHUNK_SIZE), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _resumable(self, direction, func, src, dst):
+        """Run a chunked transfer: after a connection drop, reconnect the failed legs only, back off, and resume from
+        the chunks already recorded."""
+        retry = Retry()
+        for attempt in range(Constants.TRANSFER_RESUME_ATTEMPTS):
+            try:
+                return func(src, dst)
+            except (socket.error, EOFError, paramiko.SSHException) as e:
+                self._device.printer.warning('Connection lost while {} ({}). Reconnecting and resuming...'.format(direction, e))
+                try:
+                    self._device.reconnect()
+                except Exception as reconnect_error:
+                    self._device.printer.debug('Reconnection failed: {}'.format(reconnect_error))
+                time.sleep(retry.backoff(attempt + 1))
+        raise Exception('Error while {} {}: {} attempts failed'.format(direction, src, Constants.TRANSFER_RESUME_ATTEMPTS))
+
+    def _chunked_download(self, src, dst, callback=None):
+        sftp = self._device._get_sftp()
+        attr = sftp.stat(src)
+        size, chunk = attr.st_size, Constants.TRANSFER_CHUNK_SIZE
+        identity = [src, size, attr.st_mtime]
+        part, sidecar = dst + '.part', dst + '.part.json'
+        done = self._sidecar_load(sidecar, identity) if os.path.exists(part) else set()
+        # Only trust the recorded chunks if the partial file covers all of them
+        if done and os.path.getsize(part) < min((max(done) + 1) * chunk, size):
+            os.remove(sidecar)
+            done = set()
+        missing = [i for i in range((size + chunk - 1) // chunk) if i not in done]
+        if done:
+            self._device.printer.verbose('Resuming download: {} bytes still missing'.format(len(missing) * chunk))
+        # Transfer the missing chunks, recording each one only once it is on disk
+        with sftp.open(src, 'rb') as fr:
+            with open(part, 'r+b' if os.path.exists(part) else 'wb') as fw:
+                for i in missing:
+                    offset = i * chunk
+                    length = min(chunk, size - offset)
+                    data = ''.join(fr.readv([(offset, length)]))
+                    if len(data) != length:
+                        raise EOFError('Short read at offset {}'.format(offset))
+                    fw.seek(offset)
+                    fw.write(data)
+                    fw.flush()
+                    os.fsync(fw.fileno())
+                    done.add(i)
+                    self._sidecar_save(sidecar, identity, done)
+                    if callback: callback(src, len(done) * chunk, size)
+                fw.truncate(size)
+        # Verify the whole file with a single remote hash
+        if self.remote_sha256(src) != self._local_sha256(part):
+            os.remove(part)
+            os.remove(sidecar)
+            raise Exception('Checksum mismatch while downloading {}. Please retry'.format(src))
+        if os.path.exists(dst): os.remove(dst)
+        os.rename(part, dst)
+        os.remove(sidecar)
+        return size
+
+    def _chunked_upload(self, src, dst, callback=None):
+        sftp = self._device._get_sftp()
+        size, chunk = os.path.getsize(src), Constants.TRANSFER_CHUNK_SIZE
+        identity = [os.path.abspath(src), size, os.path.getmtime(src), dst]
+        part, sidecar = dst + '.part', src + '.upload.json'
+        done = self._sidecar_load(sidecar, identity)
+        try:
+            # Only trust the recorded chunks if the remote partial file is still there, and covers all of them
+            if done and sftp.stat(part).st_size < min((max(done) + 1) * chunk, size):
+                done = set()
+        except IOError:
+            done = set()
+        if not done and os.path.exists(sidecar):
+            os.remove(sidecar)
+        missing = [i for i in range((size + chunk - 1) // chunk) if i not in done]
+        if done:
+            self._device.printer.verbose('Resuming upload: {} bytes still missing'.format(len(missing) * chunk))
+        with open(src, 'rb') as fr:
+            with sftp.open(part, 'r+b' if done else 'wb') as fw:
+                fw.set_pipelined(True)
+                for i in missing:
+                    offset = i * chunk
+                    fr.seek(offset)
+                    fw.seek(offset)
+                    fw.write(fr.read(chunk))
+                    # Wait for the server to acknowledge the writes before recording the chunk
+                    fw.flush()
+                    fw.stat()
+                    done.add(i)
+                    self._sidecar_save(sidecar, identity, done)
+                    if callback: callback(src, len(done) * chunk, size)
+        # Verify the whole file with a single remote hash
+        if self.remote_sha256(part) != self._local_sha256(src):
+            sftp.remove(part)
+            os.remove(sidecar)
+            raise Exception('Checksum mismatch while uploading {}. Please retry'.format(src))
+        try:
+            sftp.posix_rename(part, dst)
+        except IOError:
+            # Server without the posix-rename extension: plain rename does not overwrite
+            self.file_delete(dst)
+            sftp.rename(part, dst)
+        os.remove(sidecar)
+        return size
+
+    def download_resumable(self, src, dst, callback=None):
+        """Download a (large) file in chunks, recording progress in a local sidecar file.
+
+        After a connection drop the transfer resumes from the chunks already stored, and the final file is verified
+        against a SHA256 computed on the device.
+        """
+        src, dst = Utils.unescape_path(src), Utils.unescape_path(dst)
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, posixpath.basename(src))
+        self._device.printer.debug("Downloading (resumable): %s -> %s" % (src, dst))
+        start = time.time()
+        with Metrics().measure('transfer', 'download_resumable', detail=src) as m:
+            try:
+                nbytes = self._resumable('downloading', lambda a, b: self._chunked_download(a, b, callback), src, dst)
+            except (IOError, OSError) as e:
+                raise Exception('Error while downloading {}: {}'.format(src, e))
+            m['bytes_in'] = nbytes
+        self._transfer_report('Downloaded', nbytes, 1, start)
+
+    def upload_resumable(self, src, dst, callback=None):
+        """Upload a (large) file in chunks, recording progress in a local sidecar file.
+
+        After a connection drop the transfer resumes from the chunks already stored on the device, and the final file
+        is verified against a SHA256 computed on the device.
+        """
+        src, dst = Utils.unescape_path(src), Utils.unescape_path(dst)
+        self._device.printer.debug("Uploading (resumable): %s -> %s" % (src, dst))
+        start = time.time()
+        with Metrics().measure('transfer', 'upload_resumable', detail=src) as m:
+            try:
+                nbytes = self._resumable('uploading', lambda a, b: self._chunked_upload(a, b, callback), src, dst)
+            except (IOError, OSError) as e:
+                raise Exception('Error while uploading {}: {}'.format(src, e))
+            finally:
+                self.cache_invalidate(dst)
+            m['bytes_out'] = nbytes
+        self._transfer_report('Uploaded', nbytes, 1, start)
 
     # ==================================================================================================================
     # FILE SPECIFIC
@@ -201,13 +779,14 @@ class RemoteOperations(object):
         """Create a file with the current time of last modification, to be used as a reference."""
         ts = self.build_temp_path_for_file(fname)
         cmd = 'touch %s' % ts
-        self.command_blocking(cmd)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(ts)
         return ts
 
     def chmod_x(self, fname):
         """Chmod +x the provided path."""
         cmd = 'chmod +x %s' % fname
-        self.command_blocking(cmd)
+        self.command_blocking(cmd, write=False, idempotent=True)
 
     def parse_plist(self, plist):
         """Given a plist file, copy it to temp folder and parse it."""
@@ -227,9 +806,151 @@ class RemoteOperations(object):
         cmd = 'cat {fname}'.format(fname=fname)
         if grep_args:
             cmd += ' | grep {grep_args}'.format(grep_args=grep_args)
-        return self.command_blocking(cmd, internal=True)
+        return self.command_blocking(cmd, internal=True, write=False, idempotent=True)
 
     def write_file(self, fname, body):
         """Given a filename, write body into it"""
         cmd = "echo \"{content}\" > {dst}".format(content=body, dst=fname)
-        self.command_blocking(cmd)
+        self.command_blocking(cmd, write=False, idempotent=True)
+        self.cache_invalidate(fname)
+
+    def write_file_raw(self, fname, body):
+        """Given a filename, write body into it verbatim (over SFTP, no shell quoting involved)."""
+        fp = self._device._get_sftp().open(Utils.unescape_path(fname), 'wb')
+        try:
+            fp.set_pipelined(True)
+            fp.write(body)
+        finally:
+            fp.close()
+        self.cache_invalidate(fname)
+
+
+# ======================================================================================================================
+# STREAM WRAPPER
+# ======================================================================================================================
+class _CountingStream(object):
+    """File-like wrapper around a channel file, keeping track of the bytes read/written through it."""
+    def __init__(self, fp):
+        self._fp = fp
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._fp.read(size)
+        self.count += len(data)
+        return data
+
+    def write(self, data):
+        self._fp.write(data)
+        self.count += len(data)
+
+    def close(self):
+        pass
+
+# ======================================================================================================================
+# BATCH OF REMOTE OPERATIONS
+# ======================================================================================================================
+BatchResult = collections.namedtuple('BatchResult', ['op', 'args', 'status', 'result', 'output'])
+
+
+class RemoteBatch(object):
+    """Collect filesystem operations and ship them to the device as a single generated shell script.
+
+    Usage:
+        batch = remote_op.batch()
+        batch.dir_exist(folder)
+        batch.file_delete(fname)
+        res = batch.run()           # list of BatchResult, in the order the operations were queued
+
+    For the *_exist operations, `result` is True if the path exists. For the others, it is True if the operation succeeded.
+    """
+    # Shell fragments for each operation: an exit status of 0 means success (or "exists" for the checks)
+    OPS = {
+        'file_exist': '[ -f {0} ]',
+        'dir_exist': '[ -d {0} ]',
+        'file_create': '[ -f {0} ] || touch {0}',
+        'file_delete': '[ ! -f {0} ] || rm {0} 2> /dev/null',
+        'file_copy': 'cp {0} {1}',
+        'file_move': 'mv {0} {1}',
+        'dir_create': '[ -d {0} ] || mkdir {0}',
+        'dir_delete': '[ ! -d {0} ] || rm -rf {0} 2> /dev/null',
+        'dir_reset': 'rm -rf {0} 2> /dev/null; mkdir {0}',
+        'chmod': 'chmod {1} {0}',
+    }
+    MARKER = ':NEEDLE_BATCH:'
+
+    def __init__(self, remote_op):
+        self._remote_op = remote_op
+        self._ops = []
+
+    @staticmethod
+    def build_op(op, *args):
+        """Build the shell fragment for the given operation, escaping its path arguments."""
+        return RemoteBatch.OPS[op].format(*[Utils.escape_path(str(x)) for x in args])
+
+    def _add(self, op, *args):
+        self._ops.append((op, args))
+        return self
+
+    # ==================================================================================================================
+    # OPERATIONS
+    # ==================================================================================================================
+    def file_exist(self, path): return self._add('file_exist', path)
+
+    def file_create(self, path): return self._add('file_create', path)
+
+    def file_delete(self, path): return self._add('file_delete', path)
+
+    def file_copy(self, src, dst): return self._add('file_copy', src, dst)
+
+    def file_move(self, src, dst): return self._add('file_move', src, dst)
+
+    def dir_exist(self, path): return self._add('dir_exist', path)
+
+    def dir_create(self, path): return self._add('dir_create', path)
+
+    def dir_delete(self, path): return self._add('dir_delete', path)
+
+    def dir_reset(self, path): return self._add('dir_reset', path)
+
+    def chmod(self, path, mode): return self._add('chmod', path, mode)
+
+    # ==================================================================================================================
+    # RUN
+    # ==================================================================================================================
+    def build_script(self):
+        """Compile the queued operations into one shell script, each one followed by a marker line with its exit status."""
+        lines = []
+        for i, (op, args) in enumerate(self._ops):
+            lines.append('{{ {cmd} ; }} 2>&1; echo "{marker} {i} $?"'.format(cmd=self.build_op(op, *args),
+                                                                           marker=self.MARKER, i=i))
+        return '\n'.join(lines)
+
+    def run(self):
+        """Run all the queued operations in a single round trip, and return a BatchResult for each of them."""
+        if not self._ops:
+            return []
+        # The stat cache is kept coherent below, operation by operation
+        idempotent = all(op != 'file_move' for op, _ in self._ops)
+        out = self._remote_op.command_blocking(self.build_script(), internal=True, write=False, idempotent=idempotent)
+        results, output = [], []
+        for line in out:
+            if line.startswith(self.MARKER):
+                idx, status = line[len(self.MARKER):].split()
+                op, args = self._ops[int(idx)]
+                status = int(status)
+                results.append(BatchResult(op, args, status, status == 0, output))
+                output = []
+            else:
+                output.append(line)
+        if len(results) != len(self._ops):
+            raise Exception('Batch of remote operations interrupted: {} out of {} completed'.format(len(results), len(self._ops)))
+        # Keep the stat cache coherent
+        for res in results:
+            if res.op in ('file_exist', 'dir_exist'):
+                self._remote_op._cache_set(res.op, res.args[0], res.result)
+            elif res.op == 'chmod':
+                continue
+            else:
+                self._remote_op.cache_invalidate(*res.args)
+        self._ops = []
+        return results
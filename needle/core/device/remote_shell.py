@@ -0,0 +1,94 @@
+import re
+import time
+import uuid
+import select
+import threading
+
+from ..utils.constants import Constants
+
+
+# ======================================================================================================================
+# PERSISTENT REMOTE SHELL
+# ======================================================================================================================
+class RemoteShell(object):
+    """Long-lived, non-TTY shell running on a single channel of the SSH Transport.
+
+    Commands are streamed through it back to back, each one framed by unique markers:
+        - STDOUT: START marker, output, END marker followed by the exit code
+        - STDERR: output, END marker
+    END markers are printed on a new line of their own (the output might not end with a newline), which is then stripped.
+    Each command runs in a subshell with STDIN closed, so it can neither alter the state of the session
+    (cwd, environment) nor consume the following commands. Commands from different threads are serialized.
+    """
+    MARKER = ':NEEDLE_SHELL:'
+
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    def __init__(self, transport):
+        self._channel = transport.open_session()
+        self._channel.exec_command(Constants.SSH_SHELL)
+        self._out, self._err = '', ''
+        self._lock = threading.Lock()
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    def _drain(self):
+        """Move whatever has been received so far into the local buffers."""
+        while self._channel.recv_ready():
+            self._out += self._channel.recv(Constants.SSH_RECV_BUFFER)
+        while self._channel.recv_stderr_ready():
+            self._err += self._channel.recv_stderr(Constants.SSH_RECV_BUFFER)
+
+    # ==================================================================================================================
+    # EXPOSED COMMANDS
+    # ==================================================================================================================
+    def is_active(self):
+        """True if the shell can still accept commands."""
+        return not self._channel.closed and not self._channel.eof_received and not self._channel.exit_status_ready()
+
+    def close(self):
+        self._channel.close()
+
+    def run(self, cmd, timeout):
+        """Run a command in the shell. Returns (stdout lines, stderr lines, exit status).
+
+        If the command does not complete within `timeout` seconds, the shell is closed (it is still busy running
+        the command) and the partial output returned, with exit status None.
+        """
+        with self._lock:
+            return self._run(cmd, timeout)
+
+    def _run(self, cmd, timeout):
+        tag = '{}{}'.format(self.MARKER, uuid.uuid4().hex)
+        start, end = '{}:START'.format(tag), '{}:END'.format(tag)
+        self._channel.sendall('echo "{start}"; ( {cmd}\n) < /dev/null; printf \'\\n%s:%d\\n\' "{end}" $?; '
+                              'printf \'\\n%s\\n\' "{end}" >&2\n'.format(start=start, end=end, cmd=cmd))
+        # Wait for both the framing markers (the newline preceding each of them is not part of the output)
+        re_out = re.compile(r'\n{}:(\d+)\n'.format(re.escape(end)))
+        re_err = re.compile(r'\n{}\n'.format(re.escape(end)))
+        endtime = time.time() + timeout
+        m_out, m_err = None, None
+        while True:
+            self._drain()
+            m_out, m_err = re_out.search(self._out), re_err.search(self._err)
+            if m_out and m_err:
+                break
+            if not self.is_active():
+                raise Exception('The remote shell has been closed unexpectedly')
+            remaining = endtime - time.time()
+            if remaining <= 0:
+                self.close()
+                break
+            select.select([self._channel], [], [], remaining)
+        # Extract the framed output
+        out_start = self._out.find('{}\n'.format(start))
+        out_start = out_start + len(start) + 1 if out_start >= 0 else 0
+        if m_out and m_err:
+            out, err, status = self._out[out_start:m_out.start()], self._err[:m_err.start()], int(m_out.group(1))
+            self._out, self._err = self._out[m_out.end():], self._err[m_err.end():]
+        else:
+            out, err, status = self._out[out_start:], self._err, None
+            self._out, self._err = '', ''
+        return out.splitlines(True), err.splitlines(True), status
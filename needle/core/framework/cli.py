@@ -65,6 +65,12 @@ class CLI(Framework):
         self.register_option('skip_output_folder_check', Constants.GLOBAL_SKIP_OUTPUT_FOLDER_CHECK, False, 'Skip the check that ensures the output folder does not already contain other files. '
                                                                                                            'It will automatically overwrite any file')
         self.register_option('hide_system_apps', Constants.GLOBAL_HIDE_SYSTEM_APPS, True, 'If set to True, only 3rd party apps will be shown')
+        self.register_option('persistent_shell', Constants.GLOBAL_PERSISTENT_SHELL, True, 'If set to True, remote commands are streamed through a single long-lived shell '
+                                                                                          'instead of opening a new channel for each of them')
+        self.register_option('trace_file', Constants.GLOBAL_TRACE_FILE, False, 'If set, every remote/local operation is appended (with timing and size) to this JSONL file')
+        self.register_option('pull_cache_size', Constants.GLOBAL_PULL_CACHE_SIZE, True, 'Disk budget (in MB) of the local cache of files pulled from the device. Set to 0 to disable it')
+        self.register_option('decrypted_cache_device', Constants.GLOBAL_DECRYPTED_CACHE_DEVICE, True, 'If set to True, decrypted binaries are also kept on the device (in {}), '
+                                                                                                      'besides the local cache'.format(Constants.DEVICE_PATH_CACHE_FOLDER))
 
     def _init_global_vars(self):
         # Setup Printer
@@ -7,9 +7,11 @@ import readline
 import traceback
 
 from options import Options
+from ..device.decrypted_cache import DecryptedCache
 from ..device.device import Device
 from ..utils.constants import Constants
 from ..utils.menu import choose_from_list
+from ..utils.metrics import Metrics
 from ..utils.printer import Colors
 from ..utils.utils import Utils
 
@@ -285,6 +287,45 @@ class Framework(cmd.Cmd):
             print('%sNo options available for this module.' % self.spacer)
             print('')
 
+    def show_stats(self):
+        """Show timing, outcome and bytes transferred by the operations run so far, grouped by type."""
+        rows = Metrics().summary()
+        if not rows:
+            self.printer.info('No operation recorded yet.')
+            return
+        header = ['Kind', 'Name', 'Calls', 'Errors', 'Total (s)', 'Avg (s)', 'p50 (s)', 'p95 (s)', 'Max (s)',
+                  'Bytes In', 'Bytes Out']
+        self.print_table(rows, header=header, title='Stats')
+
+    def show_cache(self, params=''):
+        """Show the decrypted apps cached by the binary modules. Use "show cache evict <key|bundle_id|all>" to remove them."""
+        cache = self.device.decrypted_cache if self.device else DecryptedCache()
+        args = params.split()
+        if args:
+            if args[0] != 'evict' or len(args) != 2:
+                self.printer.error('Usage: show cache [evict <key|bundle_id|all>]')
+                return
+            keys = cache.evict(None if args[1] == 'all' else args[1])
+            if keys and self.device and self.device.decrypted_cache_device:
+                try:
+                    batch = self.device.remote_op.batch()
+                    for key in keys:
+                        batch.dir_delete(os.path.join(Constants.DEVICE_PATH_CACHE_FOLDER, key))
+                    batch.run()
+                except Exception as e:
+                    self.printer.warning('Could not remove the copies kept on the device: %s' % e)
+            self.printer.notify('Evicted %d entries' % len(keys))
+            return
+        entries = cache.entries()
+        if not entries:
+            self.printer.info('The cache is empty.')
+            return
+        rows = []
+        for key, entry in entries:
+            artifacts = ', '.join('%s (%.1f MB)' % (name, size / 1024.0 / 1024) for name, size in sorted(entry['artifacts'].items()))
+            rows.append([key[:12], entry['bundle_id'], entry['app_version'], entry['binary_hash'][:12], artifacts])
+        self.print_table(rows, header=['Key', 'Bundle ID', 'Version', 'Binary Hash', 'Artifacts'], title='Decrypted Cache')
+
     def _get_show_names(self):
         """Any method beginning with "show_" will be parsed and added as a subcommand for the show command."""
         prefix = 'show_'
@@ -455,6 +496,15 @@ class Framework(cmd.Cmd):
                 if self.options['verbose'] is False:
                     self.options['debug'] = False
                     self.printer.set_debug(self.options['debug'])
+            # Switch command channel
+            if name == 'persistent_shell' and self.device:
+                self.device.persistent_shell = bool(self.options['persistent_shell'])
+            if name == 'trace_file':
+                Metrics().set_trace_file(self.options['trace_file'])
+            if name == 'pull_cache_size' and self.device:
+                self.device.pull_cache.budget = int(self.options['pull_cache_size'] or 0) * 1024 * 1024
+            if name == 'decrypted_cache_device' and self.device:
+                self.device.decrypted_cache_device = bool(self.options['decrypted_cache_device'])
             # Reset output folder
             if name == 'output_folder':
                 self.printer.debug("Output folder changed, reloading modules")
@@ -477,7 +527,7 @@ class Framework(cmd.Cmd):
         params = ' '.join(params[1:])
         if arg in self._get_show_names():
             func = getattr(self, 'show_' + arg)
-            if arg == 'modules':
+            if arg in ('modules', 'cache'):
                 func(params)
             else:
                 func()
@@ -632,7 +682,10 @@ class Framework(cmd.Cmd):
     def _spawn_device(self):
         """Instantiate a new Device object, and open a connection."""
         IP, PORT, AGENT_PORT, USERNAME, PASSWORD, PUB_KEY_AUTH = self._parse_device_options()
-        self.device = Framework.device = Device(IP, PORT, AGENT_PORT, USERNAME, PASSWORD, PUB_KEY_AUTH, self.TOOLS_LOCAL)
+        self.device = Framework.device = Device(IP, PORT, AGENT_PORT, USERNAME, PASSWORD, PUB_KEY_AUTH, self.TOOLS_LOCAL,
+                                                persistent_shell=self._global_options['persistent_shell'],
+                                                pull_cache_size=self._global_options['pull_cache_size'],
+                                                decrypted_cache_device=self._global_options['decrypted_cache_device'])
 
     def _connection_new(self):
         """Try to instantiate a new connection with the device."""
@@ -2,11 +2,13 @@ import os
 import pty
 import time
 import shutil
+import socket
 import datetime
 import threading
 import subprocess
 
 from ..utils.constants import Constants
+from ..utils.metrics import Metrics
 from ..utils.printer import Printer
 from ..utils.utils import Utils
 
@@ -89,8 +91,8 @@ class LocalOperations(object):
         """Run a command in a subprocess and resume execution immediately."""
         self.printer.debug('[LOCAL CMD] Local Subprocess Command: %s' % cmd)
         DEVNULL = open(os.devnull, 'w')
-        proc = subprocess.Popen(cmd.split(), stdout=DEVNULL, stderr=subprocess.STDOUT)
-        time.sleep(2)
+        with Metrics().measure('local', os.path.basename(cmd.split()[0])):
+            proc = subprocess.Popen(cmd.split(), stdout=DEVNULL, stderr=subprocess.STDOUT)
         return proc
 
     def command_subproc_stop(self, proc):
@@ -98,17 +100,38 @@ class LocalOperations(object):
         self.printer.debug('[LOCAL CMD] Stopping Local Subprocess Command [pid: %s]' % proc.pid)
         proc.terminate()
 
+    def wait_for_port(self, host, port, banner=None, timeout=Constants.PORT_READY_TIMEOUT):
+        """Wait until host:port accepts connections and, if `banner` is given, greets with it.
+        Returns True as soon as the port is ready, False if it is not within `timeout` seconds."""
+        endtime = time.time() + timeout
+        while True:
+            remaining = endtime - time.time()
+            if remaining <= 0: return False
+            sock = None
+            try:
+                sock = socket.create_connection((host, int(port)), timeout=remaining)
+                if not banner or sock.recv(len(banner)) == banner:
+                    return True
+            except socket.error:
+                pass
+            finally:
+                if sock: sock.close()
+            time.sleep(Constants.PORT_READY_POLL)
+
     def command_blocking(self, cmd):
         """Run a blocking command: wait for its completion before resuming execution."""
         self.printer.debug('[LOCAL CMD] Local Command: %s' % cmd)
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        stdout, stderr = proc.stdout.read(), proc.stderr.read()
+        with Metrics().measure('local', os.path.basename(cmd.split()[0])) as m:
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
+            stdout, stderr = proc.stdout.read(), proc.stderr.read()
+            m['bytes_in'] = len(stdout) + len(stderr)
         return stdout, stderr
 
     def command_interactive(self, cmd):
         """Run an interactive command: which requires an interactive shell."""
         self.printer.debug("[LOCAL CMD] Local Interactive Command: %s" % cmd)
-        out = subprocess.call(cmd, shell=True)
+        with Metrics().measure('local', os.path.basename(cmd.split()[0])):
+            out = subprocess.call(cmd, shell=True)
         return out
 
     def command_background_start(self, cmd):
@@ -2,6 +2,9 @@ from __future__ import print_function
 import os
 import json
 import time
+import Queue
+import types
+import threading
 import textwrap
 
 from ..framework.framework import Framework, FrameworkException
@@ -160,7 +163,11 @@ class BaseModule(Framework):
     # UTILS
     # ==================================================================================================================
     def print_cmd_output(self, txt, outfile=None, silent=False):
-        """Pretty print output coming from command execution. Also save it to file if specified"""
+        """Pretty print output coming from command execution. Also save it to file if specified.
+
+        `txt` can also be a generator (e.g., from command_stream): each item is printed and saved as soon as it arrives,
+        and the number of items consumed is returned.
+        """
         def print_screen(content):
             content_type = type(content)
             if content_type is dict:
@@ -183,6 +190,24 @@ class BaseModule(Framework):
             else:
                 fp.write('%s\n' % content.strip())
 
+        if isinstance(txt, types.GeneratorType):
+            # Stream: print and save incrementally
+            fp, count = None, 0
+            if outfile:
+                if type(outfile) is not str:
+                    self.printer.error("Please specify a valid path if you want to save to file")
+                else:
+                    self.printer.info("Saving output to file: {}".format(outfile))
+                    fp = open(outfile, 'w')
+            try:
+                for item in txt:
+                    count += 1
+                    if not silent: print_screen(item)
+                    if fp: print_file(item)
+            finally:
+                if fp: fp.close()
+            return count
+
         if txt:
             # Print to screen
             if not silent:
@@ -196,6 +221,78 @@ class BaseModule(Framework):
                     with open(outfile, 'w') as fp:
                         print_file(txt)
 
+    def dump_files(self, fnames, fetch, process=None, max_parallel=Constants.DUMP_MAX_PARALLEL,
+                   local_workers=Constants.DUMP_LOCAL_WORKERS):
+        """Dump a list of remote files through a two-stage pipeline.
+
+        `fetch(fname)` (the transfer) is run by a pool of `max_parallel` workers, and its result is handed to
+        `process(fname, result)` (local parsing/writing) on a pool of `local_workers`, so transfers never wait for
+        local work. A failure only affects its own file. Progress is reported in the same order of `fnames`.
+        Returns the list of files that could not be dumped.
+        """
+        total = len(fnames)
+        todo, fetched, done = Queue.Queue(), Queue.Queue(), Queue.Queue()
+        for i, fname in enumerate(fnames):
+            todo.put((i, fname))
+
+        def transfer_worker():
+            # Each worker runs its commands on exec channels of its own, rather than queueing on the persistent shell
+            with self.device.exec_channels():
+                while True:
+                    try:
+                        i, fname = todo.get_nowait()
+                    except Queue.Empty:
+                        return
+                    try:
+                        fetched.put((i, fname, fetch(fname), None))
+                    except Exception as e:
+                        fetched.put((i, fname, None, e))
+
+        def local_worker():
+            while True:
+                item = fetched.get()
+                if item is None: return
+                i, fname, res, err = item
+                if err is None and process:
+                    try:
+                        process(fname, res)
+                    except Exception as e:
+                        err = e
+                done.put((i, fname, err))
+
+        def start(target):
+            t = threading.Thread(name='dump', target=target)
+            t.setDaemon(True)
+            t.start()
+            return t
+
+        def close_local_stage(transfers):
+            # Once all the transfers are over, tell each local worker to stop
+            for t in transfers: t.join()
+            for _ in range(local_workers): fetched.put(None)
+
+        transfers = [start(transfer_worker) for _ in range(max(1, min(max_parallel, total)))]
+        local_workers = max(1, local_workers)
+        for _ in range(local_workers): start(local_worker)
+        start(lambda: close_local_stage(transfers))
+
+        # Report progress in order: results completed out of order are held until their predecessors are done
+        completed, failed, nxt = {}, [], 0
+        for _ in range(total):
+            i, fname, err = done.get()
+            completed[i] = (fname, err)
+            while nxt in completed:
+                fname, err = completed.pop(nxt)
+                nxt += 1
+                if err:
+                    failed.append(fname)
+                    self.printer.error('[{}/{}] Failed to dump {}: {}'.format(nxt, total, fname.strip(), err))
+                else:
+                    self.printer.verbose('[{}/{}] Dumped {}'.format(nxt, total, fname.strip()))
+        if failed:
+            self.printer.warning('{} out of {} files could not be dumped'.format(len(failed), total))
+        return failed
+
     def validate_editor(self):
         """Check that the user entered a recognised editor in the PROGRAM option by seeing if it exists in the TOOLS_LOCAL directory."""
         if self.options['program'] in self.TOOLS_LOCAL:
@@ -269,7 +366,6 @@ class FridaModule(BaseModule):
             if not self.device._frida_server:
                 self.printer.info("Setting up local port forwarding to enable communications with the Frida server...")
                 self.device._portforward_frida_start()
-                time.sleep(1)
                 return 1
             else:
                 self.printer.info("Local port forwarding to enable communications with the Frida server already setup")
@@ -307,7 +403,7 @@ class FridaScript(FridaModule):
             # Launching the app
             self.printer.info("Launching the app...")
             self.device.app.open(self.APP_METADATA['bundle_id'])
-            pid = int(self.device.app.search_pid(self.APP_METADATA['binary_name']))
+            pid = int(self.device.app.search_pid(self.APP_METADATA['binary_name'], self.APP_METADATA['binary_path'], wait=True))
             # Attaching to the process
             self.printer.info("Attaching to process: %s" % pid)
             self.session = device.attach(pid)
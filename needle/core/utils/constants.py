@@ -25,6 +25,9 @@ class Constants(object):
     FOLDER_HOME = os.path.join(os.path.expanduser('~'), NAME_FOLDER)
     FOLDER_TEMP = os.path.join(FOLDER_HOME, 'tmp')
     FOLDER_BACKUP = os.path.join(FOLDER_HOME, 'backup')
+    FOLDER_CACHE = os.path.join(FOLDER_HOME, 'cache')
+    FOLDER_CACHE_PULL = os.path.join(FOLDER_CACHE, 'pull')
+    FOLDER_CACHE_DECRYPTED = os.path.join(FOLDER_CACHE, 'decrypted')
     FILE_HISTORY = os.path.join(FOLDER_HOME, 'needle_history')
     FILE_DB = 'issues.db'
 
@@ -44,6 +47,10 @@ class Constants(object):
     GLOBAL_SAVE_HISTORY = True
     GLOBAL_SKIP_OUTPUT_FOLDER_CHECK = False
     GLOBAL_HIDE_SYSTEM_APPS = False
+    GLOBAL_PERSISTENT_SHELL = False
+    GLOBAL_PULL_CACHE_SIZE = 512
+    GLOBAL_DECRYPTED_CACHE_DEVICE = False
+    GLOBAL_TRACE_FILE = ''
     PASSWORD_CLEAR = 'password_clear'
     PASSWORD_MASK = '********'
 
@@ -54,9 +61,12 @@ class Constants(object):
     AGENT_VERSION_MARK = "VERSION: "
     AGENT_OUTPUT_END = " :OUTPUT_END:"
     AGENT_TIMEOUT_READ = 5
+    AGENT_RECV_BUFFER = 65536
+    AGENT_POOL_SIZE = 2
     AGENT_CMD_STOP = "stop"
     AGENT_CMD_OS_VERSION = "os_version"
     AGENT_CMD_LIST_APPS = "list_apps"
+    AGENT_CACHE_TTL = {AGENT_CMD_OS_VERSION: 24 * 60 * 60, AGENT_CMD_LIST_APPS: 10 * 60}
 
     # MODULE COMPATIBILITY
     MODULES_DISABLED = {
@@ -101,12 +111,42 @@ class Constants(object):
     # ==================================================================================================================
     # DEVICE PATHS
     DEVICE_PATH_TEMP_FOLDER  = '/var/root/needle/'
+    DEVICE_PATH_CACHE_FOLDER = '/var/root/needle_cache/'
     DEVICE_PATH_TRUST_STORE  = '/private/var/Keychains/TrustStore.sqlite3'
     DEVICE_PATH_FRIDA_CACHE  = '/Library/Caches/frida-*'
     DEVICE_PATH_HOSTS        = '/etc/hosts'
     DEVICE_PATH_EFFECTIVE_USER_SETTINGS_IOS9_AND_BELOW = '/var/mobile/Library/ConfigurationProfiles/EffectiveUserSettings.plist'
     DEVICE_PATH_EFFECTIVE_USER_SETTINGS_IOS10 = '/var/mobile/Library/UserConfigurationProfiles/EffectiveUserSettings.plist'
 
+    # SSH
+    SSH_COMMAND_TIMEOUT = 30
+    SSH_BANNER = 'SSH-'
+    PORT_READY_TIMEOUT = 10
+    PORT_READY_POLL = 0.05
+    SSH_KEEPALIVE = 15
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8
+    SSH_BACKGROUND_TIMEOUT = 5
+    SSH_RECV_BUFFER = 32768
+    SSH_SHELL = '/bin/sh'
+    SSH_MAX_PARALLEL = 4
+    REMOTE_CACHE_TTL = 60
+    MANIFEST_TTL = 60
+    PROCESS_TABLE_TTL = 2
+    PID_WAIT_TIMEOUT = 10
+    PID_WAIT_POLL = 0.1
+    FILEDP_TIMEOUT = 300
+    DUMP_MAX_PARALLEL = 4
+    DUMP_LOCAL_WORKERS = 2
+    PULL_CACHE_LINK = False
+    SFTP_WINDOW_SIZE = 16 * 1024 * 1024
+    SFTP_MAX_PACKET_SIZE = 32768
+    SFTP_CHUNK_SIZE = 256 * 1024
+    TRANSFER_CHUNK_SIZE = 4 * 1024 * 1024
+    TRANSFER_RESUME_ATTEMPTS = 3
+    TRANSFER_HASH_TIMEOUT = 300
+    MACHO_HEADER_SIZE = 4096
+
     # DEVICE TOOLS
     FRIDA_PORT = 27042
     DEBUG_PORT = 12345
@@ -133,6 +173,8 @@ class Constants(object):
             'PLUTIL': {'COMMAND': 'plutil', 'PACKAGES': ['com.ericasadun.utilities'], 'REPO': None, 'LOCAL': None, 'SETUP': None},
             'UNZIP':  {'COMMAND': 'unzip', 'PACKAGES': ['unzip'], 'REPO': None, 'LOCAL': None, 'SETUP': None},
             'STRINGS': {'COMMAND': 'strings', 'PACKAGES': None, 'REPO': None, 'LOCAL': None, 'SETUP': None},
+            'SHA256SUM': {'COMMAND': 'sha256sum', 'PACKAGES': None, 'REPO': None, 'LOCAL': None, 'SETUP': None},
+            'TAR': {'COMMAND': 'tar', 'PACKAGES': ['tar', 'gzip'], 'REPO': None, 'LOCAL': None, 'SETUP': None},
 
             # TOOLKITS
             'COREUTILS': {'COMMAND': None, 'PACKAGES': ['coreutils', 'coreutils-bin'], 'REPO': None, 'LOCAL': None, 'SETUP': None},
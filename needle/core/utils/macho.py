@@ -0,0 +1,104 @@
+import struct
+import collections
+
+
+# ======================================================================================================================
+# MACH-O FORMAT
+# ======================================================================================================================
+FAT_MAGIC, FAT_MAGIC_64 = 0xcafebabe, 0xcafebabf
+MH_MAGIC, MH_MAGIC_64 = 0xfeedface, 0xfeedfacf
+MH_PIE = 0x200000
+LC_ENCRYPTION_INFO, LC_ENCRYPTION_INFO_64 = 0x21, 0x2c
+CPU_ARCH_ABI64 = 0x01000000
+CPU_SUBTYPE_MASK = 0x00ffffff
+
+CPU_TYPES = {7: 'i386', 7 | CPU_ARCH_ABI64: 'x86_64',
+             12: 'arm', 12 | CPU_ARCH_ABI64: 'arm64',
+             18: 'ppc', 18 | CPU_ARCH_ABI64: 'ppc64'}
+CPU_SUBTYPES = {
+    12: {5: 'armv4t', 6: 'armv6', 7: 'armv5', 9: 'armv7', 10: 'armv7f', 11: 'armv7s', 12: 'armv7k', 14: 'armv6m',
+         15: 'armv7m', 16: 'armv7em'},
+    12 | CPU_ARCH_ABI64: {0: 'arm64', 1: 'arm64v8', 2: 'arm64e'},
+}
+
+Slice = collections.namedtuple('Slice', ['arch', 'offset', 'size'])
+MachInfo = collections.namedtuple('MachInfo', ['arch', 'pie', 'encrypted'])
+
+
+# ======================================================================================================================
+# HEADER PARSER
+# ======================================================================================================================
+class MachO(object):
+    """Pure Python reader of fat/thin Mach-O headers: it only needs the first bytes of the binary (or of a slice)."""
+
+    @staticmethod
+    def arch_name(cputype, cpusubtype):
+        """Name of the architecture, as reported by lipo."""
+        subtypes = CPU_SUBTYPES.get(cputype, {})
+        name = subtypes.get(cpusubtype & CPU_SUBTYPE_MASK) or CPU_TYPES.get(cputype)
+        return name if name else 'unknown({},{})'.format(cputype, cpusubtype & CPU_SUBTYPE_MASK)
+
+    @staticmethod
+    def _thin_header(data):
+        """Return (endianness, is64, fields of the mach_header) of a thin Mach-O."""
+        if len(data) >= 28:
+            for endian in ('<', '>'):
+                magic = struct.unpack_from(endian + 'I', data, 0)[0]
+                if magic in (MH_MAGIC, MH_MAGIC_64):
+                    # magic, cputype, cpusubtype, filetype, ncmds, sizeofcmds, flags
+                    return endian, magic == MH_MAGIC_64, struct.unpack_from(endian + 'IiiIIII', data, 0)
+        raise Exception('Not a Mach-O file')
+
+    @staticmethod
+    def parse_slices(header, file_size):
+        """List the slices (arch, offset, size) of a binary, given its first bytes and its total size.
+        A thin binary is reported as a single slice spanning the whole file."""
+        if len(header) >= 8 and struct.unpack_from('>I', header, 0)[0] in (FAT_MAGIC, FAT_MAGIC_64):
+            is64 = struct.unpack_from('>I', header, 0)[0] == FAT_MAGIC_64
+            nfat = struct.unpack_from('>I', header, 4)[0]
+            fmt, entry_size = ('>iiQQI', 32) if is64 else ('>iiIII', 20)
+            if 8 + nfat * entry_size > len(header):
+                raise Exception('Truncated fat header ({} architectures)'.format(nfat))
+            slices = []
+            for i in range(nfat):
+                cputype, cpusubtype, offset, size, align = struct.unpack_from(fmt, header, 8 + i * entry_size)
+                slices.append(Slice(MachO.arch_name(cputype, cpusubtype), offset, size))
+            return slices
+        endian, is64, fields = MachO._thin_header(header)
+        return [Slice(MachO.arch_name(fields[1], fields[2]), 0, file_size)]
+
+    @staticmethod
+    def commands_size(data):
+        """Number of bytes (from the start of a thin Mach-O) spanned by its header and load commands."""
+        endian, is64, fields = MachO._thin_header(data)
+        return (32 if is64 else 28) + fields[5]
+
+    @staticmethod
+    def parse_info(data):
+        """PIE flag and encryption status of a thin Mach-O (or slice). `data` must span all its load commands."""
+        endian, is64, fields = MachO._thin_header(data)
+        magic, cputype, cpusubtype, filetype, ncmds, sizeofcmds, flags = fields
+        offset, encrypted = (32 if is64 else 28), False
+        for _ in range(ncmds):
+            if offset + 8 > len(data):
+                raise Exception('Truncated load commands')
+            cmd, cmdsize = struct.unpack_from(endian + 'II', data, offset)
+            if cmd in (LC_ENCRYPTION_INFO, LC_ENCRYPTION_INFO_64):
+                cryptoff, cryptsize, cryptid = struct.unpack_from(endian + 'III', data, offset + 8)
+                encrypted = encrypted or cryptid != 0
+            if cmdsize < 8: break
+            offset += cmdsize
+        return MachInfo(MachO.arch_name(cputype, cpusubtype), bool(flags & MH_PIE), encrypted)
+
+    @staticmethod
+    def extract_slice(src, dst, slice, chunk_size=1024 * 1024):
+        """Copy a single slice of a local binary into `dst`."""
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            fin.seek(slice.offset)
+            remaining = slice.size
+            while remaining > 0:
+                data = fin.read(min(chunk_size, remaining))
+                if not data:
+                    raise Exception('Unexpected end of file while extracting the {} slice'.format(slice.arch))
+                fout.write(data)
+                remaining -= len(data)
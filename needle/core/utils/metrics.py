@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+
+# ======================================================================================================================
+# METRICS REGISTRY
+# ======================================================================================================================
+class Metrics(object):
+    """In-process registry of the operations performed (remote commands, transfers, agent calls, local commands).
+
+    For each (kind, name) it keeps counters (calls, errors, bytes in/out) and a latency histogram.
+    Every operation can also be appended to a JSONL trace file.
+    """
+    # ==================================================================================================================
+    # INIT
+    # ==================================================================================================================
+    __instance = None
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __new__(cls, *args, **kwargs):
+        """Metrics needs to be a Singleton, shared by the framework and the device."""
+        if not cls.__instance:
+            cls.__instance = super(Metrics, cls).__new__(cls, *args, **kwargs)
+            cls.__instance._lock = threading.Lock()
+            cls.__instance._stats = {}
+            cls.__instance._trace = None
+        return cls.__instance
+
+    # ==================================================================================================================
+    # UTILS
+    # ==================================================================================================================
+    def _percentile(self, hist, count, q):
+        """Upper bound of the histogram bucket containing the q-th percentile."""
+        target, seen = q * count, 0
+        for i, n in enumerate(hist):
+            seen += n
+            if seen >= target:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else float('inf')
+        return float('inf')
+
+    # ==================================================================================================================
+    # EXPOSED COMMANDS
+    # ==================================================================================================================
+    def set_trace_file(self, path):
+        """Append every operation to the given JSONL file. An empty path stops tracing."""
+        with self._lock:
+            if self._trace:
+                self._trace.close()
+                self._trace = None
+            if path:
+                self._trace = open(os.path.expanduser(path), 'a')
+
+    def record(self, kind, name, duration, bytes_in=0, bytes_out=0, ok=True, detail=None):
+        """Record a completed operation."""
+        with self._lock:
+            st = self._stats.get((kind, name))
+            if st is None:
+                st = self._stats[(kind, name)] = {'calls': 0, 'errors': 0, 'time': 0.0, 'max': 0.0,
+                                                  'bytes_in': 0, 'bytes_out': 0, 'hist': [0] * (len(self.BUCKETS) + 1)}
+            st['calls'] += 1
+            st['errors'] += 0 if ok else 1
+            st['time'] += duration
+            st['max'] = max(st['max'], duration)
+            st['bytes_in'] += bytes_in
+            st['bytes_out'] += bytes_out
+            st['hist'][bisect.bisect_left(self.BUCKETS, duration)] += 1
+            if self._trace:
+                self._trace.write(json.dumps({'ts': time.time(), 'kind': kind, 'name': name, 'duration': duration,
+                                              'bytes_in': bytes_in, 'bytes_out': bytes_out, 'ok': ok,
+                                              'detail': detail}) + '\n')
+                self._trace.flush()
+
+    @contextlib.contextmanager
+    def measure(self, kind, name, bytes_out=0, detail=None):
+        """Time the enclosed block. It receives a dict where to report the bytes transferred ('bytes_in'/'bytes_out').
+        The operation is recorded as failed if the block raises."""
+        sizes = {'bytes_in': 0, 'bytes_out': bytes_out}
+        start, ok = time.time(), True
+        try:
+            yield sizes
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record(kind, name, time.time() - start, sizes['bytes_in'], sizes['bytes_out'], ok, detail)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def summary(self):
+        """Return one row per (kind, name): calls, errors, total/avg/p50/p95/max time (s), bytes in, bytes out."""
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda x: x[1]['time'], reverse=True)
+            rows = []
+            for (kind, name), st in stats:
+                rows.append([kind, name, st['calls'], st['errors'], '%.3f' % st['time'],
+                             '%.3f' % (st['time'] / st['calls']),
+                             '<%s' % self._percentile(st['hist'], st['calls'], 0.5),
+                             '<%s' % self._percentile(st['hist'], st['calls'], 0.95),
+                             '%.3f' % st['max'], st['bytes_in'], st['bytes_out']])
+            return rows
@@ -3,6 +3,8 @@ import re
 import io
 import time
 import json
+import random
+import functools
 import biplist
 import plistlib
 from pprint import pprint
@@ -28,6 +30,17 @@ class Utils(object):
             path = re.sub('(?<!\\\\)`', '\`', path)
         return pipes.quote(path)
 
+    @staticmethod
+    def unescape_path(path):
+        """Revert escape_path: return the raw path, as expected by SFTP."""
+        import shlex
+        path = path.strip()
+        try:
+            parts = shlex.split(path)
+        except ValueError:
+            return path
+        return parts[0] if len(parts) == 1 else path
+
     @staticmethod
     def escape_path_scp(path):
         """To be correctly handled by scp, paths must be quoted 2 times."""
@@ -179,34 +192,56 @@ class Utils(object):
 # RETRY DECORATOR
 # ======================================================================================================================
 class Retry(object):
+    """Decorator for retrying a Device/NeedleAgent operation if the connection it relies on fails.
+
+    When the operation raises, the health of its connection `leg` ('ssh' or 'agent') is checked. If the leg is alive,
+    the error is not a connection problem, and is raised straight away. Otherwise, only the failed legs are
+    re-established, and the operation is re-run after an exponential backoff (with jitter).
+    Operations which are not safe to repeat can opt out with the `idempotent=False` keyword argument: the connection
+    is still restored, but the error is raised.
+    """
     default_exceptions = (Exception)
 
-    def __init__(self, tries=3, exceptions=None, delay=0):
-        """Decorator for retrying function if exception occurs."""
+    def __init__(self, tries=3, exceptions=None, delay=None, max_delay=None, leg='ssh'):
+        from constants import Constants  # Constants depends on this module (through the Printer)
         self.tries = tries
         if exceptions is None:
             exceptions = Retry.default_exceptions
         self.exceptions = exceptions
-        self.delay = delay
-        self.actual_tries = 0
+        self.delay = Constants.RETRY_BASE_DELAY if delay is None else delay
+        self.max_delay = Constants.RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.leg = leg
+
+    def backoff(self, attempt):
+        """Delay before the given attempt: random in [0, delay * 2^attempt], capped at max_delay ("full jitter")."""
+        return random.uniform(0, min(self.max_delay, self.delay * 2 ** attempt))
 
     def __call__(self, func):
+        @functools.wraps(func)
         def wrapper(obj, *args, **kwargs):
             # Check who is calling: Device or NeedleAgent
             device = obj._device if 'NeedleAgent' in type(obj).__name__ else obj
-            exception = None
-            while self.actual_tries < self.tries:
+            idempotent = kwargs.pop('idempotent', True)
+            # The retry state is local to each call
+            attempt = 0
+            while True:
                 try:
                     return func(obj, *args, **kwargs)
                 except self.exceptions, e:
-                    self.actual_tries += 1
-                    exception = e
-                    device.printer.error(exception)
-                    device.disconnect()
-                    device.printer.warning("Resetting connection to device...")
-                    device.connect()
+                    if device.is_alive(self.leg):
+                        raise
+                    attempt += 1
+                    device.printer.error(e)
+                    try:
+                        device.reconnect()
+                    except Exception as reconnect_error:
+                        device.printer.debug('Reconnection failed: {}'.format(reconnect_error))
+                    if not idempotent:
+                        raise Exception('The connection to the device has been reset, but the last command has not '
+                                        'been re-run, as it is not safe to repeat it ({})'.format(e))
+                    if attempt >= self.tries:
+                        raise Exception("An error occurred and it was not possible to restore it "
+                                        "({} attempts failed)".format(self.tries))
+                    time.sleep(self.backoff(attempt))
                     device.printer.warning("Rerunning last command...")
-                    time.sleep(self.delay)
-            self.actual_tries = 0
-            raise Exception("An error occurred and it was not possible to restore it ({} attempts failed)".format(self.tries))
         return wrapper
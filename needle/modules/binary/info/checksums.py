@@ -26,11 +26,13 @@ class Module(BaseModule):
     def __init__(self, params):
         BaseModule.__init__(self, params)
 
-    def compute_checksum(self, kind):
-        cmd = "{} {}".format(kind, self.path)
-        out = self.device.remote_op.command_blocking(cmd)
-        checksum = out[0].split(" ")[0]
-        self.RES[kind] = checksum
+    def compute_checksums(self):
+        # The hashes are independent: compute them concurrently
+        cmds = ["{} {}".format(kind, self.path) for kind in self.CHECKSUMS]
+        outs = self.device.remote_op.command_many(cmds, write=False)
+        for kind, out in zip(self.CHECKSUMS, outs):
+            checksum = out[0].split(" ")[0]
+            self.RES[kind] = checksum
 
     def print_checksums(self):
         self.printer.notify("The following checksums have been computed:")
@@ -45,6 +47,6 @@ class Module(BaseModule):
         self.printer.info("Calculating checksums for: {path}".format(path=self.path))
 
         # Computing
-        map(self.compute_checksum, self.CHECKSUMS)
+        self.compute_checksums()
         # Printing
         self.print_checksums()
@@ -17,57 +17,77 @@ class Module(BaseModule):
     # ==================================================================================================================
     # UTILS
     # ==================================================================================================================
-    def __run_otool(self, query, grep=None):
-        """Run otool against a specific architecture."""
-        cmd = '{bin} {query} {app}'.format(bin=self.device.DEVICE_TOOLS['OTOOL'],
-                                              query=query,
-                                              app=self.APP_METADATA['binary_path'])
+    def __otool_cmd(self, query, grep=None, arch=None):
+        """Build the otool command for a specific query (restricted to a single slice, if `arch` is given)."""
+        cmd = '{bin} {arch}{query} {app}'.format(bin=self.device.DEVICE_TOOLS['OTOOL'],
+                                                 arch='-arch {} '.format(arch) if arch else '',
+                                                 query=query,
+                                                 app=self.APP_METADATA['binary_path'])
         if grep: cmd = '%s | grep -Ei "%s"' % (cmd, grep)
-        out = self.device.remote_op.command_blocking(cmd)
-        return out
+        return cmd
 
-    def __check_flag(self, line, flagname, flag):
+    def __check_flag(self, tests, line, flagname, flag):
         """Extract result of the test."""
         tst = filter(lambda el: re.search(flag, el), line)
         res = True if tst and len(tst) > 0 else False
-        self.tests[flagname] = res
+        tests[flagname] = res
 
     # ==================================================================================================================
     # CHECKS
     # ==================================================================================================================
-    def _check_cryptid(self):
-        out = self.__run_otool('-l', grep='cryptid')
-        self.__check_flag(out, "Encrypted", "cryptid(\s)+1")
+    def _run_checks(self, slices):
+        """Encryption and PIE come from the Mach-O header of each slice; ARC and stack canaries from otool."""
+        tests = collections.OrderedDict()
+        for sl in slices:
+            info = self.device.app.get_binary_info(self.APP_METADATA['binary_path'], sl)
+            tests[sl] = collections.OrderedDict([("Encrypted", info.encrypted), ("PIE", info.pie)])
+        # Each check is an independent otool run, on a single slice: (name, flag, query, grep)
+        checks = [
+            ("ARC", "_objc_release", '-IV', 'objc_release'),
+            ("Stack Canaries", "___stack_chk_", '-IV', '___stack_chk_(fail|guard)'),
+        ]
+        runs = [(sl, check) for sl in slices for check in checks]
+        outs = self.device.remote_op.command_many([self.__otool_cmd(query, grep, sl.arch)
+                                                   for sl, (_, _, query, grep) in runs], write=False)
+        for (sl, (name, flag, _, _)), out in zip(runs, outs):
+            self.__check_flag(tests[sl], out, name, flag)
+        return tests
 
-    def _check_pie(self):
-        out = self.__run_otool('-hv')
-        self.__check_flag(out, "PIE", "PIE")
-
-    def _check_arc(self):
-        out = self.__run_otool('-IV', grep='(\(architecture|objc_release)')
-        self.__check_flag(out, "ARC", "_objc_release")
-
-    def _check_stack_canaries(self):
-        out = self.__run_otool('-IV', grep='(\(architecture|___stack_chk_(fail|guard))')
-        self.__check_flag(out, "Stack Canaries", "___stack_chk_")
+    def _run_checks_whole(self):
+        """Fallback for binaries whose Mach-O header cannot be parsed: every check is an otool run on the whole binary."""
+        tests = collections.OrderedDict()
+        # Each check is an independent otool run: (name, flag, query, grep)
+        checks = [
+            ("Encrypted", "cryptid(\s)+1", '-l', 'cryptid'),
+            ("PIE", "PIE", '-hv', None),
+            ("ARC", "_objc_release", '-IV', '(\(architecture|objc_release)'),
+            ("Stack Canaries", "___stack_chk_", '-IV', '(\(architecture|___stack_chk_(fail|guard))'),
+        ]
+        outs = self.device.remote_op.command_many([self.__otool_cmd(query, grep) for _, _, query, grep in checks], write=False)
+        for (name, flag, _, _), out in zip(checks, outs):
+            self.__check_flag(tests, out, name, flag)
+        return tests
 
     # ==================================================================================================================
     # RUN
     # ==================================================================================================================
     def module_run(self):
         self.printer.verbose("Analyzing binary...")
-        for arch in self.APP_METADATA['architectures']:
-            self.tests = collections.defaultdict(dict)
-            # Checks
-            self._check_cryptid()
-            self._check_pie()
-            self._check_arc()
-            self._check_stack_canaries()
-            # Print Output
-            self.printer.notify(arch)
-            for name, val in self.tests.items():
+        # Checks
+        try:
+            slices = self.device.app.get_slices(self.APP_METADATA['binary_path'])
+            results = [('{} (offset: {}, size: {})'.format(sl.arch, sl.offset, sl.size), sl.arch, tests)
+                       for sl, tests in self._run_checks(slices).items()]
+        except Exception as e:
+            self.printer.warning('Could not parse the Mach-O header ({}), checking the whole binary with otool'.format(e))
+            tests = self._run_checks_whole()
+            results = [(arch, arch, tests) for arch in self.APP_METADATA['architectures']]
+        # Print Output
+        for title, arch, tests in results:
+            self.printer.notify(title)
+            for name, val in tests.items():
                 if val:
                     self.printer.notify('\t{:>20}: {}{:<30}{}'.format(name, Colors.G, 'OK', Colors.N))
                 else:
                     self.printer.error('\t{:>20}: {}{:<30}{}'.format(name, Colors.R, 'NO', Colors.N))
-                    self.add_issue('Compilation check', '{}: NO'.format(name), 'HIGH', None)
+                    self.add_issue('Compilation check', '{} ({}): NO'.format(name, arch), 'HIGH', None)
@@ -26,8 +26,9 @@ class Module(BaseModule):
         dst = self.device.remote_op.build_temp_path_for_file("app.ipa")
         # Upload binary to device
         self.printer.verbose("Uploading binary: %s" % src)
-        self.device.remote_op.upload(src, dst)
+        self.device.remote_op.upload_resumable(src, dst)
         # Install
         self.printer.verbose("Installing binary...")
         cmd = "{bin} {app}".format(bin=self.device.DEVICE_TOOLS['IPAINSTALLER'], app=dst)
         self.device.remote_op.command_interactive_tty(cmd)
+        self.device.apps_changed()
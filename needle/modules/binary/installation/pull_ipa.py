@@ -32,9 +32,8 @@ class Module(BaseModule):
         fname_local_ipa = self.options['output']
 
         if self.options['decrypt']:
-            # Decrypt the binary first
-            fname_remote = self.device.remote_op.build_temp_path_for_file('decrypted.ipa')
-            self.fname_binary = self.device.app.decrypt(self.APP_METADATA)
+            # Decrypt the binary first (or reuse a previously decrypted IPA), then pull the IPA
+            self.device.app.pull_decrypted_ipa(self.APP_METADATA, fname_local_ipa)
         else:
             # Recover the IPA
             self.printer.info("Recovering the IPA...")
@@ -42,13 +41,12 @@ class Module(BaseModule):
                                                       bundle=self.APP_METADATA['bundle_id'],
                                                       out=fname_remote)
             self.device.remote_op.command_blocking(cmd)
-
-        # Pull file
-        self.device.pull(fname_remote, fname_local_ipa)
+            # Pull file
+            self.device.pull(fname_remote, fname_local_ipa, resumable=True)
 
         # Pull the binary if this has been set.
         if self.options['pull_binary']:
             self.printer.info("Recovering the binary...")
-            self.fname_binary = self.device.app.unpack_ipa(self.APP_METADATA, fname_remote)
-            fname_local_bin = self.local_op.build_output_path_for_file(self.fname_binary, self)
-            self.device.pull(self.fname_binary, fname_local_bin)
+            fname_local_bin = self.local_op.build_output_path_for_file(self.APP_METADATA['binary_name'], self)
+            # Extracted from the IPA just pulled: nothing else needs to be unzipped or transferred
+            self.device.app.extract_binary_local(self.APP_METADATA, fname_local_ipa, fname_local_bin)
@@ -38,7 +38,7 @@ class Module(BaseModule):
             cmd = '{bin} -H -o {folder} "{appbin}" 2>/dev/null'.format(bin=self.device.DEVICE_TOOLS['CLASS-DUMP'],
                                                                        folder=folder_remote,
                                                                        appbin=self.fname_binary)
-            self.device.remote_op.command_blocking(cmd)
+            self.device.remote_op.command_blocking(cmd, write=True)
 
             # Download interfaces
             self.printer.info("Retrieving interfaces...")
@@ -48,14 +48,13 @@ class Module(BaseModule):
             # Dump classes
             self.printer.info("Dumping classes...")
             cmd = '{bin} "{appbin}" 2>/dev/null'.format(bin=self.device.DEVICE_TOOLS['CLASS-DUMP'], appbin=self.fname_binary)
-            out = self.device.remote_op.command_blocking(cmd)
+            out = self.device.remote_op.command_stream(cmd)
             # Save to file
             outfile = self.options['output'] if self.options['output'] else None
-            # Print to console
-            if out:
-                self.printer.notify("The following content has been dumped: ")
-                self.print_cmd_output(out, outfile)
-            else:
+            # Print to console (and file) while the content is dumped
+            self.printer.notify("The following content has been dumped: ")
+            dumped = self.print_cmd_output(out, outfile)
+            if not dumped:
                 self.printer.warning("It was not possible to dump interfaces.")
                 self.printer.warning("This might happen if this is 64bit binary. In such case, 'cycript' or 'hooking/frida/script_enum-all-methods' are recommended")
 
@@ -31,15 +31,14 @@ class Module(BaseModule):
         # Launch the app
         self.printer.info("Launching the app...")
         self.device.app.open(self.APP_METADATA['bundle_id'])
-        pid = self.device.app.search_pid(self.APP_METADATA['binary_name'])
+        pid = self.device.app.search_pid(self.APP_METADATA['binary_name'], self.APP_METADATA['binary_path'], wait=True)
 
         # Create temp files/folders
         dir_dumps = self.device.remote_op.build_temp_path_for_file("gdb_dumps")
         fname_mach = self.device.remote_op.build_temp_path_for_file("gdb_mach")
         fname_ranges = self.device.remote_op.build_temp_path_for_file("gdb_ranges")
         self.device.remote_op.write_file(fname_mach, "info mach-regions")
-        if self.device.remote_op.dir_exist(dir_dumps): self.device.remote_op.dir_delete(dir_dumps)
-        self.device.remote_op.dir_create(dir_dumps)
+        self.device.remote_op.dir_reset(dir_dumps)
 
         # Enumerate Mach Regions
         self.printer.info("Enumerating mach regions...")
@@ -74,7 +74,8 @@ class Module(BaseModule):
             cfg_str=repr(self.cfg),
             perl=self.device.DEVICE_TOOLS['PERL'],
             nic=self.device.DEVICE_TOOLS['THEOS_NIC'])
-        self.device.remote_op.command_blocking(cmd)
+        self.device.remote_op.command_blocking(cmd, write=True)
+        self.device.remote_op.cache_invalidate(self.project_folder)
         # Print content
         self.printer.info('Tweak created:')
         out = self.device.remote_op.dir_list(self.project_folder)
@@ -103,11 +104,13 @@ class Module(BaseModule):
         self.printer.info("Installing the Tweak...")
         cmd = "export THEOS=/private/var/theos && export PATH=$THEOS/bin:$PATH && cd {proj} && make package install".format(proj=self.project_folder)
         self.device.remote_op.command_interactive_tty(cmd)
+        self.device.apps_changed()
 
     def _tweak_disinstall(self):
         self.printer.info("Disinstalling the Tweak...")
         cmd = "{dpkg} -r {package}".format(dpkg=self.device.DEVICE_TOOLS['DPKG'], package=self.options['package_name'])
         out = self.device.remote_op.command_blocking(cmd)
+        self.device.apps_changed()
         self.print_cmd_output(out)
 
     # ==================================================================================================================
@@ -33,9 +33,8 @@ class Module(BaseModule):
     def _print_structure(self, directory):
         cmd = "{bin} {dir_str}".format(bin=self.device.DEVICE_TOOLS['FIND'], dir_str=directory['path'])
         cmd = cmd + self.tree
-        out = self.device.remote_op.command_blocking(cmd)
         self.device.printer.notify("Content of the {} folder:".format(directory['name']))
-        self.print_cmd_output(out)
+        self.print_cmd_output(self.device.remote_op.command_stream(cmd))
 
     def _download_folder(self, directory):
         self.device.printer.info("Retrieving the content of the {} folder. This might take a while...".format(directory['name']))
@@ -82,11 +82,9 @@ class Module(BaseModule):
     def module_run(self):
         self.printer.info("Looking for Cache.db files...")
 
-        # Compose cmd string
-        dirs = [self.APP_METADATA['bundle_directory'], self.APP_METADATA['data_directory']]
-        dirs_str = ' '.join(dirs)
-        cmd = '{bin} {dirs_str} -type f -name "*Cache.db"'.format(bin=self.device.DEVICE_TOOLS['FIND'], dirs_str=dirs_str)
-        out = self.device.remote_op.command_blocking(cmd)
+        # Filter the manifest of the app's containers
+        manifest = self.device.app.get_manifest(self.APP_METADATA)
+        out = manifest.files(patterns=['*Cache.db'])
 
         # No files found
         if not out:
@@ -98,7 +96,7 @@ class Module(BaseModule):
 
         # Add data protection class
         self.printer.info("Retrieving data protection classes...")
-        retrieved_files = self.device.app.get_dataprotection(out)
+        retrieved_files = manifest.dataprotection(out)
 
         # Analysis
         self.printer.info("The following Cache.db files have been found:")
@@ -115,9 +113,6 @@ class Module(BaseModule):
         # Dump all
         if self.options['dump_all']:
             self.printer.notify('Dumping all Cache.db files...')
-            for fname in out:
-                remote_name = Utils.escape_path(fname)
-                # Convert the path to a valid filename
-                local_name = self.device.app.convert_path_to_filename(fname, self.APP_METADATA)
-                # Save it locally
-                self.save_file(remote_name, local_name)
+            # Pull the files concurrently
+            self.dump_files(out, lambda fname: self.save_file(
+                Utils.escape_path(fname), self.device.app.convert_path_to_filename(fname, self.APP_METADATA)))
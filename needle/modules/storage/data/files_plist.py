@@ -1,5 +1,7 @@
 from core.framework.module import BaseModule
 from core.utils.menu import choose_from_list_data_protection
+from core.utils.constants import Constants
+from core.utils.metrics import Metrics
 from core.utils.utils import Utils
 
 
@@ -28,11 +30,17 @@ class Module(BaseModule):
         # Setting default output file
         self.options['output'] = self._global_options['output_folder']
 
-    def save_file(self, remote_name, local_name, silent):
-        """Convert the plist file to XML and save it locally"""
-        # Parse the plist
+    def fetch_file(self, remote_name, local_name):
+        """Pull the plist in a temp file of its own, so that multiple files can be fetched concurrently"""
         self.printer.debug("Dumping content of the file: {}".format(remote_name))
-        pl = self.device.remote_op.parse_plist(remote_name)
+        temp_path = self.local_op.build_temp_path_for_file('plist_{}'.format(local_name), self)
+        self.device.pull(remote_name, temp_path)
+        return temp_path
+
+    def convert_file(self, temp_path, local_name, silent):
+        """Parse the local copy of the plist file, convert it to XML and save it"""
+        with Metrics().measure('local', 'plist_parse', detail=temp_path):
+            pl = Utils.plist_read_from_file(temp_path)
         # Prepare path
         local_name = 'plist_{}'.format(local_name)
         plist_path = self.local_op.build_output_path_for_file(local_name, self)
@@ -40,17 +48,20 @@ class Module(BaseModule):
         outfile = str(plist_path) if self.options['output'] else None
         self.print_cmd_output(pl, outfile, silent)
 
+    def save_file(self, remote_name, local_name, silent):
+        """Convert the plist file to XML and save it locally"""
+        temp_path = self.fetch_file(remote_name, local_name)
+        self.convert_file(temp_path, local_name, silent)
+
     # ==================================================================================================================
     # RUN
     # ==================================================================================================================
     def module_run(self):
         self.printer.info("Looking for Plist files...")
 
-        # Compose cmd string
-        dirs = [self.APP_METADATA['bundle_directory'], self.APP_METADATA['data_directory']]
-        dirs_str = ' '.join(dirs)
-        cmd = '{bin} {dirs_str} -type f -name "*.plist"'.format(bin=self.device.DEVICE_TOOLS['FIND'], dirs_str=dirs_str)
-        out = self.device.remote_op.command_blocking(cmd)
+        # Filter the manifest of the app's containers
+        manifest = self.device.app.get_manifest(self.APP_METADATA)
+        out = manifest.files(patterns=['*.plist'])
 
         # No files found
         if not out:
@@ -62,7 +73,7 @@ class Module(BaseModule):
 
         # Add data protection class
         self.printer.info("Retrieving data protection classes...")
-        retrieved_files = self.device.app.get_dataprotection(out)
+        retrieved_files = manifest.dataprotection(out)
 
         # Analysis
         self.printer.info("The following Plist files have been found:")
@@ -79,9 +90,10 @@ class Module(BaseModule):
         # Dump all
         if self.options['dump_all']:
             self.printer.notify('Dumping all plist files...')
-            for fname in out:
-                remote_name = Utils.escape_path(fname)
-                # Convert the plist path to a valid filename
-                local_name = self.device.app.convert_path_to_filename(fname, self.APP_METADATA)
-                # Convert the plist and save it locally
-                self.save_file(remote_name, local_name, self.options['silent'])
+            silent = self.options['silent']
+            local_name = lambda fname: self.device.app.convert_path_to_filename(fname, self.APP_METADATA)
+            # Pull the plists concurrently, then convert and save them locally (one at a time, if printing to screen)
+            self.dump_files(out,
+                            lambda fname: self.fetch_file(Utils.escape_path(fname), local_name(fname)),
+                            lambda fname, temp_path: self.convert_file(temp_path, local_name(fname), silent),
+                            local_workers=Constants.DUMP_LOCAL_WORKERS if silent else 1)